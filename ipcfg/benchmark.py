@@ -0,0 +1,302 @@
+"""Measuring the speed of a System on the available platforms
+
+Platform.getSpeed() is a fixed estimate for each platform, which says
+nothing about how fast a particular System runs on this machine; OpenCL
+running on a CPU, for instance, or the Reference platform for a tiny
+system. benchmarkPlatforms() instead times a short run of the actual
+System on each platform. The runs are minimized first and use a Langevin
+integrator with a small timestep, so that they are stable whatever the
+timestep of the simulation, and a platform that fails is reported rather
+than quietly left out of the choice.
+
+benchmarkThreads() does the same for different numbers of threads on the
+CPU platform, and recommendThreads() picks the thread count that gives the
+most total throughput when a node is packed with as many jobs as fit.
+
+The choices are remembered in a BenchmarkChoices file, keyed on a
+fingerprint of the host and a hash of the System, so each benchmark only
+needs to run once for each System on each machine.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import os
+import json
+import math
+import time
+import socket
+import hashlib
+import platform
+import multiprocessing
+from datetime import datetime
+
+# openmm
+import simtk.openmm as mm
+from simtk.unit import femtoseconds, picoseconds, kelvin, kilojoules_per_mole
+
+from .setupcache import writeAtomically
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['hostFingerprint', 'timeSteps', 'timeSystem', 'benchmarkPlatforms',
+           'benchmarkThreads', 'recommendThreads', 'BenchmarkChoices',
+           'DEFAULT_DIRECTORY']
+
+# Where results are kept when no cache directory is given
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.openmm-cmd')
+
+#-----------------------------------------------------------------------------
+# Utilities
+#-----------------------------------------------------------------------------
+
+def cpuModel():
+    "The model name of the CPU, as well as we can tell"
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    return platform.processor() or platform.machine()
+
+
+def hostDescription():
+    "A dict describing the hardware and OS of this machine"
+    return {'hostname': socket.gethostname(),
+            'cpu': cpuModel(),
+            'cpuCount': multiprocessing.cpu_count(),
+            'machine': platform.machine(),
+            'system': platform.system()}
+
+
+def hostFingerprint():
+    "A short hash identifying this machine, from its hostDescription()"
+    description = hostDescription()
+    text = repr(sorted(description.items())).encode('utf-8')
+    return hashlib.sha1(text).hexdigest()[:16]
+
+
+def timeSteps(context, numSteps=1000, minTime=1.0):
+    """Time how long a Context takes per step.
+
+    The first step, which includes compiling the kernels on the GPU
+    platforms, is not counted. After that, steps are run in batches of
+    increasing size, until either numSteps steps have been run or minTime
+    seconds have passed, so slow platforms don't take long to measure.
+
+    Parameters:
+     - context (Context) The context to time, with the positions set
+     - numSteps (int) The maximum number of steps to time
+     - minTime (float) Stop once this many seconds have been spent
+    Returns: The wall clock time per step, in seconds
+    """
+    integrator = context.getIntegrator()
+    integrator.step(1)
+    # Downloading the positions waits for the queued work to finish
+    context.getState(getPositions=True)
+
+    steps = 0
+    batch = 1
+    start = time.time()
+    while steps < numSteps:
+        batch = min(batch, numSteps - steps)
+        integrator.step(batch)
+        context.getState(getPositions=True)
+        steps += batch
+        batch *= 2
+        if time.time() - start >= minTime:
+            break
+    return (time.time() - start) / steps
+
+
+def timeSystem(system, positions, platformName, properties=None, dt=1*femtoseconds,
+               boxVectors=None, numSteps=1000, minTime=1.0, minimizeIterations=100):
+    """Time a short run of a System with a LangevinIntegrator.
+
+    The cost of a step doesn't depend on the timestep, so a small one is
+    used, after a short minimization, to keep the run from blowing up when
+    the positions are straight out of a coordinate file.
+
+    Parameters:
+     - system (System) The system to time
+     - positions (list) The positions of the particles
+     - platformName (string) The platform to run on
+     - properties (dict) The platform properties, or None
+     - dt (time) The time step
+     - boxVectors (tuple) The periodic box vectors, if they differ from
+       the default ones in the System
+     - numSteps, minTime Passed to timeSteps()
+     - minimizeIterations (int) The maximum number of minimizer iterations
+       before the run, or 0 not to minimize
+    Returns: The wall clock time per step, in seconds
+    Raises: ValueError if the energy is not finite after the run
+    """
+    integrator = mm.LangevinIntegrator(300*kelvin, 1/picoseconds, dt)
+    if properties is None:
+        context = mm.Context(system, integrator, mm.Platform.getPlatformByName(platformName))
+    else:
+        context = mm.Context(system, integrator, mm.Platform.getPlatformByName(platformName), properties)
+    if boxVectors is not None:
+        context.setPeriodicBoxVectors(*boxVectors)
+    context.setPositions(positions)
+    if minimizeIterations > 0:
+        mm.LocalEnergyMinimizer.minimize(context, 10*kilojoules_per_mole, minimizeIterations)
+    context.setVelocitiesToTemperature(300*kelvin)
+    seconds = timeSteps(context, numSteps, minTime)
+    energy = context.getState(getEnergy=True).getPotentialEnergy().value_in_unit(kilojoules_per_mole)
+    if math.isnan(energy) or math.isinf(energy):
+        raise ValueError('The simulation blew up on the %s platform' % platformName)
+    return seconds
+
+
+def benchmarkPlatforms(system, positions, platforms, boxVectors=None, numSteps=1000,
+                       minTime=1.0, log=None):
+    """Time a short run of a System on each of a number of platforms.
+
+    The timings use timeSystem(). The integrator a simulation uses makes
+    little difference to the relative speed of the platforms.
+
+    Parameters:
+     - system (System) The system to time
+     - positions (list) The positions of the particles
+     - platforms (dict) The property dict (or None) to use for each
+       platform, by platform name
+     - boxVectors (tuple) The periodic box vectors, if they differ from
+       the default ones in the System
+     - numSteps, minTime Passed to timeSteps()
+     - log (Logger) If given, the timing for each platform is logged to it
+    Returns: A tuple (timings, failures) of dicts by platform name. timings
+    has the seconds per step on each platform that ran the system, and
+    failures has the error message of each one that didn't. The fastest
+    platform can only be trusted if there were no failures.
+    """
+    timings = {}
+    failures = {}
+    for name in sorted(platforms):
+        properties = platforms[name]
+        try:
+            timings[name] = timeSystem(system, positions, name, properties,
+                                       boxVectors=boxVectors, numSteps=numSteps, minTime=minTime)
+        except Exception as e:
+            failures[name] = str(e)
+            if log is not None:
+                log.warning('Could not benchmark the %s platform: %s' % (name, e))
+            continue
+        if log is not None:
+            log.info('%s platform: %.3f ms/step' % (name, 1000 * timings[name]))
+    return timings, failures
+
+
+def benchmarkThreads(system, positions, maxThreads, boxVectors=None, numSteps=1000,
+                     minTime=1.0, log=None):
+    """Time a short run of a System on the CPU platform with 1, 2, 4, ...
+    threads, up to maxThreads.
+
+    Parameters are as for benchmarkPlatforms(), except for
+     - maxThreads (int) The largest number of threads to try, which is
+       always included even if it isn't a power of two
+    Returns: A dict with the seconds per step for each thread count
+    """
+    counts = []
+    n = 1
+    while n < maxThreads:
+        counts.append(n)
+        n *= 2
+    counts.append(maxThreads)
+
+    timings = {}
+    for n in counts:
+        timings[n] = timeSystem(system, positions, 'CPU', {'CpuThreads': str(n)},
+                                boxVectors=boxVectors, numSteps=numSteps, minTime=minTime)
+        if log is not None:
+            log.info('%d threads: %.3f ms/step' % (n, 1000 * timings[n]))
+    return timings
+
+
+def recommendThreads(timings, numCores):
+    """Choose the number of threads per job that gives the most throughput
+    when a node is filled with as many jobs as fit.
+
+    Parameters:
+     - timings (dict) The seconds per step for each thread count, as
+       returned by benchmarkThreads()
+     - numCores (int) The number of cores available for jobs
+    Returns: A tuple (best, table). best is the recommended thread count,
+    and table is a list of (threads, secondsPerStep, efficiency, jobs,
+    aggregateStepsPerSecond), where efficiency is the parallel efficiency
+    relative to one thread.
+    """
+    single = timings[min(timings)] * min(timings)
+    table = []
+    for n in sorted(timings):
+        jobs = numCores // n
+        efficiency = single / (n * timings[n])
+        table.append((n, timings[n], efficiency, jobs, jobs / timings[n]))
+    best = max(table, key=lambda row: row[4])
+    return best[0], table
+
+#-----------------------------------------------------------------------------
+# Classes
+#-----------------------------------------------------------------------------
+
+class BenchmarkChoices(object):
+    """The choices made from benchmarks, such as the fastest platform, for
+    each System on each host, stored in a JSON file.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, name='platform-choices'):
+        """Create a BenchmarkChoices.
+
+        Parameters:
+         - directory (string) The directory of the file that the choices are
+           stored in. It is created if it doesn't exist.
+         - name (string) The name of the file, without the .json extension
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.fileName = os.path.join(directory, name + '.json')
+
+    def key(self, system, settings):
+        """The key of the choice for a System on this host.
+
+        Parameters:
+         - system (System) The system being run
+         - settings (dict) Anything else that the choice depends on, such as
+           the platforms being considered and the property dicts they are
+           used with
+        """
+        def canonical(value):
+            if isinstance(value, dict):
+                return sorted((k, canonical(v)) for k, v in value.items())
+            return value
+
+        hash = hashlib.sha1()
+        hash.update(('%s %s\n' % (hostFingerprint(), mm.Platform.getOpenMMVersion())).encode('utf-8'))
+        hash.update(repr(canonical(settings)).encode('utf-8'))
+        hash.update(mm.XmlSerializer.serializeSystem(system).encode('utf-8'))
+        return hash.hexdigest()
+
+    def _read(self):
+        if not os.path.exists(self.fileName):
+            return {}
+        with open(self.fileName) as f:
+            return json.load(f)
+
+    def get(self, key):
+        "The choice made for a key, or None"
+        entry = self._read().get(key)
+        if entry is None:
+            return None
+        return entry['choice']
+
+    def set(self, key, choice, timings):
+        """Remember the choice made for a key, along with the timings that
+        it was made from"""
+        choices = self._read()
+        choices[key] = {'choice': choice,
+                        'timings': timings,
+                        'host': hostDescription(),
+                        'date': datetime.now().isoformat()}
+        writeAtomically(self.fileName, json.dumps(choices, indent=1), mode='w')
@@ -0,0 +1,138 @@
+"""A record of benchmark results, for catching performance regressions
+
+Results are appended to a JSON lines file, one record per benchmark case
+per run. Each record holds the speed (ns/day) of every trial, and is keyed
+by a fingerprint of the host, the OpenMM version, the platform and a hash
+of the configuration that was run. A new result is compared to the latest
+earlier record with the same host, platform and configuration, with a
+confidence interval for the change in mean speed from Welch's t-test. The
+change counts as a regression only when the whole interval lies below the
+threshold, so noisy timings alone don't raise false alarms.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import os
+import json
+import math
+import hashlib
+
+from .setupcache import hashFile
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['BenchmarkDatabase', 'configHash', 'compareTrials']
+
+# Two-sided 95% critical values of Student's t distribution, by degrees of
+# freedom. Larger degrees of freedom use the normal value, 1.96.
+T_95 = [None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+        2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093,
+        2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045,
+        2.042]
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+
+def configHash(args, directory):
+    """Hash the configuration of a benchmark case: its openmm arguments, and
+    the contents of any input files in its directory that they name.
+    """
+    hash = hashlib.sha1()
+    hash.update(repr(list(args)).encode('utf-8'))
+    for arg in args:
+        fn = os.path.join(directory, arg)
+        if os.path.isfile(fn):
+            hashFile(fn, hash)
+    return hash.hexdigest()
+
+
+def _meanVariance(values):
+    n = len(values)
+    mean = sum(values) / float(n)
+    if n < 2:
+        return mean, None
+    return mean, sum((v - mean)**2 for v in values) / (n - 1)
+
+
+def _tCritical(df):
+    "The two-sided 95% critical value of the t distribution"
+    if df >= len(T_95):
+        return 1.96
+    # round down, which is conservative for the fractional Welch df
+    return T_95[max(1, int(df))]
+
+
+def compareTrials(baseline, current):
+    """Compare the speeds of two sets of trials.
+
+    Parameters:
+     - baseline (list of float) The speeds (ns/day) in the baseline trials
+     - current (list of float) The speeds in the current trials
+    Returns: A dict with the relative change in the mean speed ('change',
+    e.g. -0.15 for 15% slower), and the 95% confidence interval of the
+    relative change ('low' and 'high'), which is None if either side has
+    fewer than two trials.
+    """
+    mean0, var0 = _meanVariance(baseline)
+    mean1, var1 = _meanVariance(current)
+    result = {'change': (mean1 - mean0) / mean0, 'low': None, 'high': None}
+    if var0 is None or var1 is None:
+        return result
+
+    # Welch's t-test, with the Welch-Satterthwaite degrees of freedom
+    se0, se1 = var0 / len(baseline), var1 / len(current)
+    se = math.sqrt(se0 + se1)
+    if se == 0:
+        result['low'] = result['high'] = result['change']
+        return result
+    df = (se0 + se1)**2 / (se0**2 / (len(baseline) - 1) + se1**2 / (len(current) - 1))
+    halfWidth = _tCritical(df) * se
+    result['low'] = (mean1 - mean0 - halfWidth) / mean0
+    result['high'] = (mean1 - mean0 + halfWidth) / mean0
+    return result
+
+#-----------------------------------------------------------------------------
+# Classes
+#-----------------------------------------------------------------------------
+
+class BenchmarkDatabase(object):
+    """Benchmark results stored in a JSON lines file.
+    """
+
+    def __init__(self, fileName):
+        """Create a BenchmarkDatabase.
+
+        Parameters:
+         - fileName (string) The file the results are stored in. It is created
+           when the first result is added.
+        """
+        self.fileName = fileName
+
+    def records(self):
+        "All of the stored records, oldest first"
+        if not os.path.exists(self.fileName):
+            return []
+        with open(self.fileName) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def latest(self, host, platform, config, openmmVersion=None):
+        """The most recent record for a host, platform and configuration hash,
+        optionally restricted to one OpenMM version, or None"""
+        for record in reversed(self.records()):
+            if (record['host'] == host and record['platform'] == platform and
+                    record['config'] == config and
+                    (openmmVersion is None or record['openmmVersion'] == openmmVersion)):
+                return record
+        return None
+
+    def add(self, record):
+        "Append a record"
+        directory = os.path.dirname(os.path.abspath(self.fileName))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.fileName, 'a') as f:
+            f.write(json.dumps(record, sort_keys=True) + '\n')
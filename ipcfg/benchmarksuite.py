@@ -0,0 +1,316 @@
+"""The `openmm benchmark` command
+
+Runs the bundled examples (or any other config files) for a fixed number of
+steps, with all of the simulation output turned off, and reports the setup
+time, the speed in ns/day and the peak memory use of each one. The results
+are printed as a table, and can also be written as JSON, so that OpenMM
+versions, hosts and settings can be compared.
+
+Every result is also added to a results database (see ipcfg.benchmarkdb),
+and compared to the previous result for the same case on the same host and
+platform, so that a slowdown after upgrading OpenMM or changing settings
+gets flagged. Running several trials of each case gives the comparison a
+confidence interval.
+
+Each example is run in a fresh openmm process, in a temporary directory
+that links to the example's input files, so that nothing is written to the
+examples directory. The command for an example is the first line of its
+command.sh that saves its output with "| tee". Any openmm commands before
+that line (such as serializing a System for the example to load) are run
+first, untimed.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import os
+import sys
+import glob
+import json
+import shlex
+import shutil
+import tempfile
+import subprocess
+from datetime import datetime
+from optparse import OptionParser
+
+# openmm
+import simtk.openmm as mm
+
+from .benchmark import hostDescription, hostFingerprint, DEFAULT_DIRECTORY
+from .benchmarkdb import BenchmarkDatabase, configHash, compareTrials
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['runBenchmarks', 'exampleCommands', 'examplesDirectory', 'runCase']
+
+USAGE = '''openmm benchmark [options] [example directory or config file ...] [-- openmm options]
+
+Run each of the examples (by default, all of them) for a fixed number of
+steps with the output turned off, and report how fast they ran. Options
+after "--" are passed on to every openmm run, for example
+"openmm benchmark -- --precision single".'''
+
+# Options that turn off everything that the benchmark doesn't need
+QUIET_OPTIONS = ['--traj_freq', '0', '--vel_freq', '0', '--progress_freq', '0',
+                 '--write_restart', 'False', '--script', 'False', '--out', '',
+                 '--log_level', 'ERROR']
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+
+def exampleCommands(directory):
+    """Get the commands that run an example.
+
+    Parameters:
+     - directory (string) The example directory, containing a command.sh
+    Returns: A tuple (setup, command). setup is a list of the argument lists
+    of the openmm commands that prepare the example, and command is the
+    argument list of the command that runs it.
+    """
+    setup = []
+    with open(os.path.join(directory, 'command.sh')) as f:
+        for line in f:
+            args = shlex.split(line.split('|')[0])
+            if len(args) == 0 or args[0] != 'openmm':
+                continue
+            if '| tee' in line:
+                return setup, args[1:]
+            setup.append(args[1:])
+    raise ValueError('%s/command.sh has no "openmm ... | tee" line' % directory)
+
+
+def examplesDirectory(script):
+    """Find the bundled examples: next to the openmm script in a source
+    checkout, or in share/openmm-cmd/examples under the installation
+    prefix, where setup.py installs them.
+
+    Returns: The path of the examples directory, or None if it wasn't found
+    """
+    candidates = [os.path.join(os.path.dirname(os.path.abspath(script)), 'examples'),
+                  os.path.join(sys.prefix, 'share', 'openmm-cmd', 'examples')]
+    for directory in candidates:
+        if os.path.isdir(directory):
+            return directory
+    return None
+
+
+def _linkInputs(source, destination):
+    "Symlink the files of the directory source into destination"
+    for name in os.listdir(source):
+        os.symlink(os.path.abspath(os.path.join(source, name)), os.path.join(destination, name))
+
+
+def _runOpenMM(script, args, cwd, log):
+    """Run openmm in a subprocess, and wait for it.
+
+    Returns: A tuple of the exit status and the resource usage of the child
+    """
+    process = subprocess.Popen([sys.executable, script] + args, cwd=cwd,
+                               stdout=log, stderr=subprocess.STDOUT)
+    # wait4 gives the resource usage of just this child
+    pid, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = status
+    return status, rusage
+
+
+def _tail(fileName, numLines=10):
+    with open(fileName) as f:
+        return ''.join(f.readlines()[-numLines:])
+
+
+def runCase(script, name, directory, setup, args, extraArgs, trials=1):
+    """Run one benchmark case.
+
+    Parameters:
+     - script (string) The path of the openmm script
+     - name (string) The name of the case
+     - directory (string) The directory containing the input files
+     - setup (list) Argument lists of untimed openmm commands to run first
+     - args (list) The arguments of the openmm command to time
+     - extraArgs (list) Arguments appended to every openmm command
+     - trials (int) The number of times to run the timed command
+    Returns: A dict with the results. The speed and setup time are the
+    means over the trials, and 'trials' lists the speed in each one.
+    """
+    result = {'name': name, 'args': args + extraArgs}
+    workdir = tempfile.mkdtemp(prefix='openmm-benchmark-')
+    log = os.path.join(workdir, 'benchmark.log')
+    try:
+        _linkInputs(directory, workdir)
+        with open(log, 'w') as f:
+            for setupArgs in setup:
+                status, _ = _runOpenMM(script, setupArgs + ['--script', 'False'] + extraArgs, workdir, f)
+                if status != 0:
+                    result['error'] = 'Setup command failed:\n' + _tail(log)
+                    return result
+
+            timings = []
+            maxrss = 0
+            timingFile = os.path.join(workdir, 'timing.json')
+            for i in range(trials):
+                status, rusage = _runOpenMM(script, args + QUIET_OPTIONS + extraArgs +
+                                            ['--timing_file', timingFile], workdir, f)
+                if status != 0 or not os.path.exists(timingFile):
+                    result['error'] = _tail(log)
+                    return result
+                with open(timingFile) as tf:
+                    timings.append(json.load(tf))
+                os.remove(timingFile)
+                maxrss = max(maxrss, rusage.ru_maxrss)
+
+        # ru_maxrss is in kilobytes on Linux, but bytes on OS X
+        maxrss *= (1 if sys.platform == 'darwin' else 1024)
+        result['maxMemoryMB'] = maxrss / float(1 << 20)
+        result['platform'] = timings[-1]['platform']
+        result['openmmVersion'] = timings[-1]['openmmVersion']
+        result['trials'] = [t['nsPerDay'] for t in timings]
+        result['nsPerDay'] = sum(result['trials']) / len(timings)
+        result['setupTime'] = sum(t['setupTime'] for t in timings) / len(timings)
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _formatChange(comparison):
+    "Format the change in speed from the baseline, with its confidence interval"
+    if comparison is None:
+        return ''
+    text = '%+.1f%%' % (100 * comparison['change'])
+    if comparison['low'] is not None:
+        text += ' [%+.1f%%, %+.1f%%]' % (100 * comparison['low'], 100 * comparison['high'])
+    if comparison['regression']:
+        text += ' REGRESSION'
+    return text
+
+
+def _printTable(results, file=sys.stdout):
+    print >>file, '%-28s %10s %12s %14s %12s  %s' % ('Case', 'Platform', 'Setup (s)', 'Speed (ns/day)',
+                                                     'Memory (MB)', 'Change (95% CI)')
+    for r in results:
+        if 'error' in r:
+            print >>file, '%-28s %10s' % (r['name'], 'FAILED')
+            continue
+        print >>file, '%-28s %10s %12.2f %14.3f %12.1f  %s' % (r['name'], r['platform'], r['setupTime'],
+            r['nsPerDay'], r['maxMemoryMB'], _formatChange(r.get('comparison')))
+
+
+def _compareAndStore(database, result, steps, save, threshold, baselineVersion):
+    """Compare a result to the latest matching one in the database, then
+    add it to the database"""
+    host = hostFingerprint()
+    baseline = database.latest(host, result['platform'], result['config'], baselineVersion)
+    if baseline is not None:
+        comparison = compareTrials(baseline['trials'], result['trials'])
+        # Only flag slowdowns that are larger than the threshold with 95%
+        # confidence. With fewer than two trials on either side there is no
+        # confidence interval, so the change is reported but not flagged.
+        comparison['regression'] = comparison['high'] is not None and comparison['high'] < -threshold
+        comparison['baselineDate'] = baseline['date']
+        comparison['baselineVersion'] = baseline['openmmVersion']
+        result['comparison'] = comparison
+
+    if save:
+        database.add({'date': datetime.now().isoformat(),
+                      'host': host,
+                      'hostDescription': hostDescription(),
+                      'openmmVersion': result['openmmVersion'],
+                      'platform': result['platform'],
+                      'config': result['config'],
+                      'name': result['name'],
+                      'args': result['args'],
+                      'steps': steps,
+                      'trials': result['trials'],
+                      'setupTime': result['setupTime'],
+                      'maxMemoryMB': result['maxMemoryMB']})
+
+
+def runBenchmarks(argv, script):
+    """Entry point of `openmm benchmark`.
+
+    Parameters:
+     - argv (list) The command line arguments after "benchmark"
+     - script (string) The path of the openmm script
+    Returns: The exit status
+    """
+    parser = OptionParser(usage=USAGE)
+    parser.add_option('--platform', help='Platform to run on. Defaults to the '
+                      'platform in each example.')
+    parser.add_option('--steps', type=int, default=1000, help='Number of steps to '
+                      'run each case for [default: %default]')
+    parser.add_option('--examples', default=examplesDirectory(script),
+                      help='Directory of examples to run when no cases are given '
+                      '[default: %default]')
+    parser.add_option('--output', help='Write the results to this file, as JSON')
+    parser.add_option('--trials', type=int, default=3, help='Number of times to run '
+                      'each case. With at least two trials, changes in speed come '
+                      'with confidence intervals, and only then are slowdowns '
+                      'flagged as regressions [default: %default]')
+    parser.add_option('--database', default=os.path.join(DEFAULT_DIRECTORY, 'benchmarks.jsonl'),
+                      help='Results database to compare against and add to '
+                      '[default: %default]')
+    parser.add_option('--no-save', dest='save', action='store_false', default=True,
+                      help="Compare against the results database, but don't add to it")
+    parser.add_option('--baseline-version', help='Compare against the latest results '
+                      'with this OpenMM version, instead of the latest results of any version')
+    parser.add_option('--threshold', type=float, default=5.0, help='Flag slowdowns larger '
+                      'than this percentage as regressions [default: %default]')
+
+    extraArgs = []
+    if '--' in argv:
+        i = argv.index('--')
+        argv, extraArgs = argv[:i], argv[i+1:]
+    options, cases = parser.parse_args(argv)
+    if options.trials < 1:
+        parser.error('--trials must be at least 1')
+    database = BenchmarkDatabase(options.database)
+
+    if len(cases) == 0:
+        if options.examples is None:
+            parser.error('The bundled examples were not found. Give their directory '
+                         'with --examples, or name the cases to run.')
+        cases = sorted(d for d in glob.glob(os.path.join(options.examples, '*'))
+                       if os.path.exists(os.path.join(d, 'command.sh')))
+        if len(cases) == 0:
+            parser.error('No examples found in %s' % options.examples)
+
+    if options.platform is not None:
+        extraArgs = ['--platform', options.platform] + extraArgs
+
+    results = []
+    for case in cases:
+        if os.path.isdir(case):
+            name = os.path.basename(os.path.normpath(case))
+            directory = case
+            setup, args = exampleCommands(case)
+        else:
+            name = os.path.basename(case)
+            directory = os.path.dirname(os.path.abspath(case))
+            setup, args = [], ['--config', os.path.abspath(case)]
+        args = args + ['--n_steps', str(options.steps)]
+        print >>sys.stderr, 'Running %s...' % name
+        result = runCase(script, name, directory, setup, args, extraArgs, options.trials)
+        if 'error' not in result:
+            result['config'] = configHash(result['args'], directory)
+            _compareAndStore(database, result, options.steps, options.save,
+                             options.threshold / 100.0, options.baseline_version)
+        results.append(result)
+
+    _printTable(results)
+    if options.output is not None:
+        report = {'date': datetime.now().isoformat(),
+                  'host': hostDescription(),
+                  'openmmVersion': mm.Platform.getOpenMMVersion(),
+                  'steps': options.steps,
+                  'platform': options.platform,
+                  'extraArgs': extraArgs,
+                  'results': results}
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=1)
+
+    failed = any('error' in r for r in results)
+    regressed = any(r.get('comparison', {}).get('regression') for r in results)
+    return int(failed or regressed)
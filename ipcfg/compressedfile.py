@@ -0,0 +1,74 @@
+"""Transparent reading of gzip, bzip2 and xz compressed files
+
+The compression format is detected from the first few bytes of the file,
+not from its extension.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import bz2
+import gzip
+try:
+    import lzma
+except ImportError:
+    # python2 only has lzma through the backports.lzma package
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['file_type', 'readMaybeCompressed']
+
+# File signatures http://www.garykessler.net/library/file_sigs.html
+magic_dict = {
+    b"\x1f\x8b\x08": "gz",
+    b"\x42\x5a\x68": "bz2",
+    b"\xfd\x37\x7a\x58\x5a\x00": "xz",
+    b"\x50\x4b\x03\x04": "zip"
+    }
+
+max_len = max(len(x) for x in magic_dict)
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+
+def file_type(filename):
+    with open(filename, 'rb') as f:
+        file_start = f.read(max_len)
+    for magic, filetype in magic_dict.items():
+        if file_start.startswith(magic):
+            return filetype
+    return "no match"
+
+
+def readMaybeCompressed(fileName):
+    """Read the entire contents of a file, decompressing it if it is
+    compressed with gzip, bzip2 or xz.
+
+    Returns: The (decompressed) contents of the file, as bytes
+    """
+    filetype = file_type(fileName)
+    if filetype == 'gz':
+        f = gzip.GzipFile(fileName, 'rb')
+    elif filetype == 'bz2':
+        f = bz2.BZ2File(fileName, 'rb')
+    elif filetype == 'xz':
+        if lzma is None:
+            raise IOError('Reading xz compressed files requires the lzma module '
+                          '(backports.lzma on python2): %s' % fileName)
+        f = lzma.LZMAFile(fileName, 'rb')
+    elif filetype == 'zip':
+        raise IOError('Reading zip archives is not supported: %s' % fileName)
+    else:
+        f = open(fileName, 'rb')
+
+    try:
+        return f.read()
+    finally:
+        f.close()
@@ -0,0 +1,76 @@
+"""Pinning the process to a set of CPU cores
+
+When several simulations share a node, each should run on its own cores so
+they don't compete with each other. setCpuAffinity() restricts this process
+(and the threads it starts afterwards, such as those of the CPU platform)
+to a list of cores. It uses os.sched_setaffinity where it exists (python
+3.3 and later), and otherwise calls sched_setaffinity from the C library,
+which is only available on Linux.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import os
+import ctypes
+import ctypes.util
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['parseCpuList', 'setCpuAffinity']
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+
+def parseCpuList(text):
+    """Parse a list of CPU cores like "0-3,8,10-11", in the format used by
+    taskset and /sys/devices/system/cpu.
+
+    Returns: A sorted list of the core indices
+    """
+    cpus = set()
+    for part in text.split(','):
+        part = part.strip()
+        if part == '':
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            first, last = int(first), int(last)
+            if last < first:
+                raise ValueError('Invalid range of CPUs: %s' % part)
+            cpus.update(range(first, last + 1))
+        else:
+            cpus.add(int(part))
+    if len(cpus) == 0:
+        raise ValueError('The list of CPUs is empty')
+    if min(cpus) < 0:
+        raise ValueError('CPU indices cannot be negative')
+    return sorted(cpus)
+
+
+def setCpuAffinity(cpus):
+    """Restrict this process to run on a set of CPU cores.
+
+    Parameters:
+     - cpus (list of int) The indices of the cores
+    """
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+        return
+
+    libcName = ctypes.util.find_library('c')
+    libc = ctypes.CDLL(libcName, use_errno=True) if libcName else None
+    if libc is None or not hasattr(libc, 'sched_setaffinity'):
+        raise OSError('Setting the CPU affinity is not supported on this system')
+
+    # cpu_set_t is a bit mask, 1024 bits long in glibc
+    mask = (ctypes.c_ulong * (1024 // (8 * ctypes.sizeof(ctypes.c_ulong))))()
+    bits = 8 * ctypes.sizeof(ctypes.c_ulong)
+    for cpu in cpus:
+        mask[cpu // bits] |= 1 << (cpu % bits)
+    if libc.sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
@@ -0,0 +1,353 @@
+"""Writer for DCD trajectory files
+
+This is a close cousin of simtk.openmm.app.DCDFile, which writes the same
+CHARMM/NAMD flavored DCD files. The differences are that this version keeps
+track of the size of the file and the step numbers of the frames that it has
+written, which the segmenting DCDReporter needs to decide when to roll over to
+a new file.
+
+The header convention is that ISTART is the step of the first frame, NSAVC
+is the interval between frames (in steps), and NSTEP is the step of the last
+frame, so that frame k (counting from zero) was written at step
+ISTART + k*NSAVC.
+
+An existing file can also be reopened to append frames to it, optionally
+truncating any frames past a given step first (for instance, the frames
+written after the restart file that a simulation is being continued from).
+
+Alongside the trajectory, DCDFile can write a small binary index file
+(output.dcd -> output.idx) with one record per frame, giving the byte offset
+of the frame in the trajectory, the step at which it was written and the
+simulation time, in picoseconds. The index makes it possible to find any frame
+without scanning the trajectory, even when frames are not evenly spaced in
+steps (for example after appending to a trajectory from a restart file), and
+is what ipcfg.dcdreader uses for random access.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import os
+import math
+import time
+import array
+import struct
+
+# openmm
+from simtk.unit import nanometers, angstroms, picoseconds, is_quantity
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['DCDFile', 'dcdFrameSize', 'readDCDHeader', 'indexFileName', 'readDCDIndex']
+
+# AKMA time unit, in picoseconds, used for the timestep in the DCD header
+AKMA_TIME = 0.04888821
+
+# Byte offsets of the fields in the header that get updated as frames are
+# written.
+NSET_OFFSET = 8
+ISTART_OFFSET = 12
+NSAVC_OFFSET = 16
+NSTEP_OFFSET = 20
+
+# Total size of the header block written by DCDFile, in bytes.
+HEADER_SIZE = 276
+
+# The index file starts with INDEX_MAGIC, followed by one INDEX_RECORD per
+# frame: (byte offset of the frame, step, time in picoseconds).
+INDEX_MAGIC = b'DCDIDX01'
+INDEX_RECORD = struct.Struct('<qqd')
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+
+def dcdFrameSize(numAtoms, hasUnitCell):
+    """Size, in bytes, of a single frame in a DCD file
+
+    Each frame contains an optional unit cell record (six doubles), followed
+    by three records with the x, y and z coordinates as 32 bit floats. Every
+    record is bracketed by 4 byte fortran record markers.
+    """
+    size = 3 * (4*numAtoms + 8)
+    if hasUnitCell:
+        size += 6*8 + 8
+    return size
+
+
+def readDCDHeader(file):
+    """Read the header of a DCD file.
+
+    Parameters:
+     - file (file) A DCD file, opened in binary mode
+    Returns: A dict with the keys 'numFrames', 'firstStep', 'interval',
+    'lastStep', 'dt' (in picoseconds), 'numAtoms', 'hasUnitCell', 'headerSize'
+    and 'frameSize'.
+    The number of frames is the number of complete frames actually present in
+    the file, which can be smaller than the count recorded in the header if
+    the program writing the file was interrupted midway through a frame.
+    """
+    file.seek(0, os.SEEK_SET)
+    block = file.read(92)
+    if len(block) != 92:
+        raise ValueError('File is too short to be a DCD file')
+    marker, magic, numFrames, firstStep, interval, lastStep = struct.unpack('<i4s4i', block[:24])
+    dt = struct.unpack('<f', block[44:48])[0] * AKMA_TIME
+    hasUnitCell = struct.unpack('<i', block[48:52])[0] != 0
+    if marker != 84 or magic != b'CORD':
+        raise ValueError('File is not a DCD file (bad magic number)')
+
+    titleLength = struct.unpack('<i', file.read(4))[0]
+    file.seek(titleLength + 4, os.SEEK_CUR)
+    numAtoms = struct.unpack('<3i', file.read(12))[1]
+    headerSize = file.tell()
+
+    frameSize = dcdFrameSize(numAtoms, hasUnitCell)
+    file.seek(0, os.SEEK_END)
+    numComplete = (file.tell() - headerSize) // frameSize
+
+    return {'numFrames': min(numFrames, numComplete), 'firstStep': firstStep,
+            'interval': interval, 'lastStep': lastStep, 'dt': dt, 'numAtoms': numAtoms,
+            'hasUnitCell': hasUnitCell, 'headerSize': headerSize,
+            'frameSize': frameSize}
+
+
+def indexFileName(fileName):
+    """Name of the frame index file for a trajectory,
+    e.g. output.dcd -> output.idx
+    """
+    return os.path.splitext(fileName)[0] + '.idx'
+
+
+def readDCDIndex(file):
+    """Read the records from a DCD frame index file.
+
+    Parameters:
+     - file (file) An index file, opened in binary mode
+    Returns: A list of (offset, step, time) tuples, one per frame.
+    """
+    file.seek(0, os.SEEK_SET)
+    if file.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+        raise ValueError('File is not a DCD index file (bad magic number)')
+    records = []
+    while True:
+        data = file.read(INDEX_RECORD.size)
+        if len(data) < INDEX_RECORD.size:
+            break
+        records.append(INDEX_RECORD.unpack(data))
+    return records
+
+#-----------------------------------------------------------------------------
+# Classes
+#-----------------------------------------------------------------------------
+
+class DCDFile(object):
+    """DCDFile provides methods for creating DCD files.
+
+    DCD is a file format for storing simulation trajectories.  It supports
+    an arbitrary number of models (frames), each with the positions of every
+    atom and, for periodic systems, the unit cell dimensions.
+    """
+
+    def __init__(self, file, topology, dt, firstStep=0, interval=1, append=False, index=None):
+        """Create a DCD file and write out the header.
+
+        Parameters:
+         - file (file) A file to write to
+         - topology (Topology) The Topology defining the molecular system being written
+         - dt (time) The time step used in the trajectory
+         - firstStep (int) The index of the first step in the trajectory
+         - interval (int) The frequency (measured in time steps) at which states are written
+         - append (bool) If True, file is an existing DCD file (opened for
+           reading and writing), and new models will be added after the ones
+           it already contains. firstStep and interval are then read from its header.
+         - index (file=None) If supplied, a file (opened for reading and
+           writing) to maintain a frame index in. When appending, an existing
+           index is extended, and a missing or incomplete one is rebuilt from
+           the trajectory header.
+        """
+        self._file = file
+        self._topology = topology
+        self._numAtoms = len(list(topology.atoms()))
+        self._hasUnitCell = topology.getUnitCellDimensions() is not None
+        self._firstStep = firstStep
+        self._interval = interval
+        self._headerSize = HEADER_SIZE
+        self._modelCount = 0
+        self._lastStep = None
+        self._index = index
+        self._steps = None
+
+        if append:
+            self._readHeader()
+            return
+
+        if is_quantity(dt):
+            dt = dt.value_in_unit(picoseconds)
+        dt /= AKMA_TIME
+
+        header = struct.pack('<i4s9if', 84, b'CORD', 0, firstStep, interval,
+                             firstStep, 0, 0, 0, 0, 0, dt)
+        header += struct.pack('<13i', int(self._hasUnitCell), 0, 0, 0, 0, 0, 0, 0, 0, 24, 84, 164, 2)
+        header += struct.pack('<80s', b'Created by OpenMM')
+        header += struct.pack('<80s', b'Created ' + time.asctime(time.localtime(time.time())).encode('ascii'))
+        header += struct.pack('<4i', 164, 4, self._numAtoms, 4)
+        assert len(header) == HEADER_SIZE
+        file.write(header)
+        if index is not None:
+            index.seek(0, os.SEEK_SET)
+            index.truncate()
+            index.write(INDEX_MAGIC)
+            index.flush()
+
+    def _readHeader(self):
+        "Pick up where the existing file we're appending to left off"
+        header = readDCDHeader(self._file)
+        if header['numAtoms'] != self._numAtoms:
+            raise ValueError('Cannot append to a DCD file with %d atoms, since the '
+                             'topology contains %d atoms' % (header['numAtoms'], self._numAtoms))
+        if header['hasUnitCell'] != self._hasUnitCell:
+            raise ValueError('Cannot append to a DCD file whose unit cell information '
+                             'does not match the topology')
+        self._firstStep = header['firstStep']
+        self._interval = header['interval']
+        self._headerSize = header['headerSize']
+        numFrames = header['numFrames']
+
+        if self._index is not None:
+            # Use the steps recorded in the index, and fill in any frames it's
+            # missing (e.g. if the index was deleted) assuming evenly spaced frames.
+            try:
+                records = readDCDIndex(self._index)[:numFrames]
+            except ValueError:
+                records = []
+            for i in range(len(records), numFrames):
+                step = self._firstStep + i*self._interval
+                records.append((self._headerSize + i*self.frameSize, step, step*header['dt']))
+            self._index.seek(0, os.SEEK_SET)
+            self._index.truncate()
+            self._index.write(INDEX_MAGIC)
+            for record in records:
+                self._index.write(INDEX_RECORD.pack(*record))
+            self._steps = [record[1] for record in records]
+
+        self._setModelCount(numFrames)
+
+    def _setModelCount(self, count):
+        "Discard any models past the first count, and update the header"
+        self._modelCount = count
+        if self._steps is not None:
+            del self._steps[count:]
+        if count == 0:
+            self._lastStep = None
+        elif self._steps is not None:
+            self._lastStep = self._steps[-1]
+        else:
+            self._lastStep = self._firstStep + (count-1)*self._interval
+        self._file.truncate(self.fileSize)
+        if self._index is not None:
+            self._index.truncate(len(INDEX_MAGIC) + count*INDEX_RECORD.size)
+            self._index.flush()
+        self._file.seek(NSET_OFFSET, os.SEEK_SET)
+        self._file.write(struct.pack('<i', count))
+        self._file.seek(NSTEP_OFFSET, os.SEEK_SET)
+        self._file.write(struct.pack('<i', self._firstStep if self._lastStep is None else self._lastStep))
+        self._file.flush()
+
+    def truncate(self, lastStep):
+        """Discard all of the models that were written after lastStep.
+
+        Parameters:
+         - lastStep (int) The step of the last model to keep
+        """
+        if self._lastStep is None or self._lastStep <= lastStep:
+            return
+        keep = 0
+        if self._steps is not None:
+            keep = len([s for s in self._steps if s <= lastStep])
+        elif lastStep >= self._firstStep:
+            keep = min(self._modelCount, (lastStep - self._firstStep) // self._interval + 1)
+        self._setModelCount(keep)
+
+    @property
+    def modelCount(self):
+        "The number of models (frames) in the file"
+        return self._modelCount
+
+    @property
+    def lastStep(self):
+        "The step number of the last model written, or None"
+        return self._lastStep
+
+    @property
+    def frameSize(self):
+        "Size, in bytes, of each model in the file"
+        return dcdFrameSize(self._numAtoms, self._hasUnitCell)
+
+    @property
+    def fileSize(self):
+        "Current size of the file, in bytes"
+        return self._headerSize + self._modelCount * self.frameSize
+
+    def writeModel(self, positions, unitCellDimensions=None, step=None, time=None):
+        """Write out a model to the DCD file.
+
+        Parameters:
+         - positions (list) The list of atomic positions to write
+         - unitCellDimensions (Vec3=None) The dimensions of the crystallographic unit cell.
+           If None, the dimensions from the Topology are used.
+         - step (int=None) The step at which this model was generated. If None,
+           it is assumed that the models are spaced by the interval given to
+           the constructor.
+         - time (time=None) The simulation time of this model, which is
+           recorded in the index.
+        """
+        if len(positions) != self._numAtoms:
+            raise ValueError('The number of positions must match the number of atoms')
+        if is_quantity(positions):
+            positions = positions.value_in_unit(nanometers)
+        coordinates = [array.array('f', (10*x[i] for x in positions)) for i in range(3)]
+        for data in coordinates:
+            if any(math.isnan(v) or math.isinf(v) for v in data):
+                raise ValueError('Particle position is NaN or infinite')
+        file = self._file
+
+        if step is None:
+            step = self._firstStep + self._modelCount*self._interval
+        if is_quantity(time):
+            time = time.value_in_unit(picoseconds)
+        elif time is None:
+            time = float('nan')
+        offset = self.fileSize
+
+        # Update the header.
+        self._modelCount += 1
+        self._lastStep = step
+        file.seek(NSET_OFFSET, os.SEEK_SET)
+        file.write(struct.pack('<i', self._modelCount))
+        file.seek(NSTEP_OFFSET, os.SEEK_SET)
+        file.write(struct.pack('<i', step))
+
+        # Write the data.
+        file.seek(0, os.SEEK_END)
+        if self._hasUnitCell:
+            if unitCellDimensions is None:
+                unitCellDimensions = self._topology.getUnitCellDimensions()
+            size = unitCellDimensions.value_in_unit(angstroms)
+            file.write(struct.pack('<i6di', 48, size[0], 0, size[1], 0, 0, size[2], 48))
+        length = struct.pack('<i', 4*self._numAtoms)
+        for data in coordinates:
+            file.write(length)
+            data.tofile(file)
+            file.write(length)
+        file.flush()
+
+        # Index the frame, now that it's been completely written.
+        if self._steps is not None:
+            self._steps.append(step)
+        if self._index is not None:
+            self._index.seek(0, os.SEEK_END)
+            self._index.write(INDEX_RECORD.pack(offset, step, time))
+            self._index.flush()
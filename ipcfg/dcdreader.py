@@ -0,0 +1,201 @@
+"""Random access reader for DCD trajectories
+
+The trajectory and the frame index written alongside it by
+ipcfg.dcdreporter.DCDReporter are both memory-mapped, so opening a
+trajectory is cheap no matter how long it is, and only the frames that are
+actually accessed are ever read from disk.
+
+Every frame in a DCD file has the same size, so the coordinates of the whole
+trajectory can be exposed as a single (numFrames, numAtoms, 3) array, which is
+a strided view onto the file that skips over the fortran record markers and
+the unit cell block of each frame. Nothing is copied until it is used.
+
+Coordinates are returned exactly as they are stored in the DCD file, as
+float32 arrays in angstroms.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import os
+
+# numpy
+import numpy as np
+
+# openmm
+from simtk.unit import angstroms, Quantity
+
+from .dcdfile import readDCDHeader, indexFileName, INDEX_MAGIC
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['DCDReader']
+
+INDEX_DTYPE = np.dtype([('offset', '<i8'), ('step', '<i8'), ('time', '<f8')])
+
+#-----------------------------------------------------------------------------
+# Classes
+#-----------------------------------------------------------------------------
+
+class DCDReader(object):
+    """DCDReader provides random access to the frames of a DCD trajectory.
+
+    Individual frames are retrieved by indexing the reader, and slicing it
+    (e.g. reader[100:200:10]) returns a view of the selected frames. The
+    coordinates of all of the frames are available as reader.xyz.
+
+        >>> reader = DCDReader('output.dcd')
+        >>> reader.xyz.shape
+        (11, 2269, 3)
+        >>> reader.steps[:3]
+        memmap([   0, 1000, 2000])
+
+    The trajectory doesn't have to have a frame index. Without one (e.g.
+    for a DCD file written by some other program) the frames are assumed to
+    be evenly spaced in steps, as described by the DCD header.
+    """
+
+    def __init__(self, fileName, indexFile=None):
+        """Open a trajectory for reading.
+
+        Parameters:
+         - fileName (string) The DCD file to read
+         - indexFile (string=None) The frame index for the trajectory. By
+           default, this is the .idx file next to the trajectory, if there is one.
+        """
+        if indexFile is None and os.path.exists(indexFileName(fileName)):
+            indexFile = indexFileName(fileName)
+
+        with open(fileName, 'rb') as f:
+            header = readDCDHeader(f)
+
+        self._numAtoms = header['numAtoms']
+        self._hasUnitCell = header['hasUnitCell']
+        self._headerSize = header['headerSize']
+        self._frameSize = header['frameSize']
+        self._data = np.memmap(fileName, dtype=np.uint8, mode='r')
+        numFrames = header['numFrames']
+
+        if indexFile is not None:
+            with open(indexFile, 'rb') as f:
+                if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                    raise ValueError('%s is not a DCD index file (bad magic number)' % indexFile)
+            numRecords = (os.path.getsize(indexFile) - len(INDEX_MAGIC)) // INDEX_DTYPE.itemsize
+            numFrames = min(numRecords, numFrames)
+        if numFrames > 0 and indexFile is not None:
+            self._index = np.memmap(indexFile, dtype=INDEX_DTYPE, mode='r',
+                                    offset=len(INDEX_MAGIC), shape=(numFrames,))
+        else:
+            self._index = np.zeros(numFrames, dtype=INDEX_DTYPE)
+            self._index['offset'] = self._headerSize + self._frameSize*np.arange(numFrames)
+            self._index['step'] = header['firstStep'] + header['interval']*np.arange(numFrames)
+            self._index['time'] = self._index['step'] * header['dt']
+
+        self._checkRecordMarkers()
+
+    def _checkRecordMarkers(self):
+        "Make sure that the first and last frames are where we expect them"
+        recordSize = 4*self._numAtoms + 8
+        if len(self) == 0:
+            return
+        for i in set([0, len(self) - 1]):
+            offset = self._headerSize + i*self._frameSize
+            if int(self._index['offset'][i]) != offset:
+                raise ValueError('The frame index does not match the trajectory')
+            if self._hasUnitCell:
+                offset += 6*8 + 8
+            markers = np.ndarray((3,), dtype='<i4', buffer=self._data,
+                                 offset=offset, strides=(recordSize,))
+            if any(markers != 4*self._numAtoms):
+                raise ValueError('Frame %d of the trajectory is corrupt' % i)
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def numAtoms(self):
+        "The number of atoms in each frame"
+        return self._numAtoms
+
+    @property
+    def steps(self):
+        "The step at which each frame was written"
+        return self._index['step']
+
+    @property
+    def times(self):
+        "The simulation time of each frame, in picoseconds"
+        return self._index['time']
+
+    @property
+    def xyz(self):
+        """The coordinates of every frame, as a (numFrames, numAtoms, 3)
+        array in angstroms. This is a read-only view into the memory-mapped
+        file, so no data is read until it is accessed.
+        """
+        offset = self._headerSize + 4
+        if self._hasUnitCell:
+            offset += 6*8 + 8
+        # The x, y and z coordinates are stored in three consecutive fortran
+        # records, so skip over the record markers with the strides.
+        return np.ndarray((len(self), self._numAtoms, 3), dtype='<f4', buffer=self._data,
+                          offset=offset, strides=(self._frameSize, 4, 4*self._numAtoms + 8))
+
+    @property
+    def unitCells(self):
+        """The lengths of the a, b and c unit cell vectors in every frame, as a
+        (numFrames, 3) array in angstroms, or None if the trajectory has no
+        unit cell information.
+        """
+        if not self._hasUnitCell:
+            return None
+        cells = np.ndarray((len(self), 6), dtype='<f8', buffer=self._data,
+                           offset=self._headerSize + 4, strides=(self._frameSize, 8))
+        return cells[:, [0, 2, 5]]
+
+    def frame(self, i):
+        """Get the coordinates of a single frame.
+
+        Parameters:
+         - i (int) The index of the frame
+        Returns: A (numAtoms, 3) array of coordinates, in angstroms. This is
+        a read-only view into the memory-mapped file.
+        """
+        return self.xyz[i]
+
+    def unitCell(self, i):
+        """Get the unit cell dimensions of a single frame.
+
+        Parameters:
+         - i (int) The index of the frame
+        Returns: An array with the lengths of the a, b and c unit cell
+        vectors, in angstroms, or None if the trajectory has no unit cell
+        information.
+        """
+        if not self._hasUnitCell:
+            return None
+        return self.unitCells[i]
+
+    def positions(self, i):
+        """Get the positions of a single frame in a form that can be passed
+        to Context.setPositions(), for instance to restart a simulation from
+        a frame of its trajectory.
+
+        Parameters:
+         - i (int) The index of the frame
+        Returns: A Quantity wrapping a (numAtoms, 3) array
+        """
+        return Quantity(np.array(self.xyz[i], dtype=np.float64), angstroms)
+
+    def frames(self, start=None, stop=None, stride=None):
+        """Get the coordinates of a range of frames.
+
+        Returns: A (numFrames, numAtoms, 3) array of coordinates, in
+        angstroms. This is a read-only view into the memory-mapped file.
+        """
+        return self.xyz[start:stop:stride]
+
+    def __getitem__(self, key):
+        return self.xyz[key]
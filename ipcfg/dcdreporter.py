@@ -0,0 +1,269 @@
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import os
+import json
+import shutil
+import tempfile
+
+# openmm
+import simtk.openmm as mm
+from simtk.unit import nanometer, picoseconds, is_quantity
+
+from .dcdfile import DCDFile, indexFileName
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['DCDReporter', 'segmentFileName', 'manifestFileName', 'readManifest']
+
+MANIFEST_FORMAT_VERSION = 1
+
+#-----------------------------------------------------------------------------
+# Utilities
+#-----------------------------------------------------------------------------
+
+def segmentFileName(fileName, index):
+    """Name of the index-th (counting from one) segment of a trajectory,
+    e.g. output.dcd -> output.part0001.dcd
+    """
+    base, ext = os.path.splitext(fileName)
+    return '%s.part%04d%s' % (base, index, ext)
+
+
+def manifestFileName(fileName):
+    """Name of the manifest file listing the segments of a trajectory,
+    e.g. output.dcd -> output.manifest.json
+    """
+    base, ext = os.path.splitext(fileName)
+    return '%s.manifest.json' % base
+
+
+def readManifest(fileName):
+    """Read the list of segments from a trajectory manifest file.
+
+    Each segment is a dict with the keys 'file', 'firstStep', 'lastStep',
+    'firstTime', 'lastTime' (in picoseconds) and 'numFrames'. The file names
+    are relative to the directory containing the manifest.
+    """
+    with open(fileName) as f:
+        data = json.load(f)
+    if 'version' not in data or data['version'] != MANIFEST_FORMAT_VERSION:
+        raise ValueError("I don't know how to read this trajectory manifest.")
+    return data['segments']
+
+
+def writeManifest(fileName, segments):
+    """Atomically write the list of segments to a trajectory manifest file"""
+    data = {'version': MANIFEST_FORMAT_VERSION,
+            'segments': segments}
+
+    # Write to a temporary file in the same directory, then move it to the
+    # proper location, so that a reader never sees a half-written manifest.
+    tmp_fd, tmp_fn = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fileName)))
+    try:
+        with os.fdopen(tmp_fd, 'w') as f:
+            json.dump(data, f, indent=1)
+        try:
+            shutil.move(tmp_fn, fileName)
+        except OSError:
+            # On windows, OSError will be raised if the file exists
+            os.remove(fileName)
+            shutil.move(tmp_fn, fileName)
+    finally:
+        if os.path.exists(tmp_fn):
+            os.remove(tmp_fn)
+
+#-----------------------------------------------------------------------------
+# Classes
+#-----------------------------------------------------------------------------
+
+class DCDReporter(object):
+    """DCDReporter outputs a series of frames from a Simulation to a DCD file.
+
+    Optionally, the trajectory can be split into a series of segment files
+    (output.part0001.dcd, output.part0002.dcd, ...), rolling over to a new
+    segment once the current one reaches a maximum size on disk or spans a
+    maximum amount of simulated time. In that case, a manifest file
+    (output.manifest.json) listing the step range covered by each segment is
+    kept up to date as the simulation runs, so that finished segments can be
+    moved or analyzed while the simulation continues.
+
+    When continuing a simulation from a restart file, the reporter can append
+    to the existing trajectory instead of starting a new one. Any frames that
+    were written after the step the simulation is restarting from are
+    discarded first, so the trajectory doesn't end up with duplicated or
+    out-of-order frames.
+
+    Each trajectory file is accompanied by a frame index file (output.idx),
+    which ipcfg.dcdreader uses for random access to the frames.
+
+    To use it, create a DCDReporter, then add it to the Simulation's list of
+    reporters.
+    """
+
+    def __init__(self, fileName, reportInterval, segmentSize=0, segmentTime=0, append=False):
+        """Create a DCDReporter.
+
+        Parameters:
+         - fileName (string) The file to write to
+         - reportInterval (int) The interval (in time steps) at which to write frames
+         - segmentSize (int) If nonzero, the maximum size of each segment file, in bytes
+         - segmentTime (time) If nonzero, the maximum span of simulated time
+           covered by each segment file
+         - append (bool) Continue an existing trajectory, if there is one,
+           instead of overwriting it. Frames past the step the simulation is at
+           before it starts running (the restart step) are truncated. A segmented
+           trajectory is continued in a new segment, after the last one listed
+           in its manifest.
+        """
+        if is_quantity(segmentTime):
+            segmentTime = segmentTime.value_in_unit(picoseconds)
+
+        self._reportInterval = reportInterval
+        self._fileName = fileName
+        self._segmentSize = segmentSize
+        self._segmentTime = segmentTime
+        self._isSegmented = segmentSize > 0 or segmentTime > 0
+        self._out = None
+        self._index = None
+        self._dcd = None
+        self._segments = []
+        self._segmentStartTime = None
+        self._append = append
+        self._restartStep = None
+        self._lastStep = None
+
+        if self._isSegmented:
+            self._manifestFile = manifestFileName(fileName)
+            if append and os.path.exists(self._manifestFile):
+                self._segments = readManifest(self._manifestFile)
+
+    def describeNextReport(self, simulation):
+        """Get information about the next report this object will generate.
+
+        Parameters:
+         - simulation (Simulation) The Simulation to generate a report for
+        Returns: A five element tuple.  The first element is the number of steps until the
+        next report.  The remaining elements specify whether that report will require
+        positions, velocities, forces, and energies respectively.
+        """
+        if self._append and self._restartStep is None:
+            # This is called before the first step is integrated, so the
+            # simulation is still at the step it was restarted from
+            self._restartStep = simulation.currentStep
+        steps = self._reportInterval - simulation.currentStep % self._reportInterval
+        return (steps, True, False, False, False)
+
+    def report(self, simulation, state):
+        """Generate a report.
+
+        Parameters:
+         - simulation (Simulation) The Simulation to generate a report for
+         - state (State) The current state of the simulation
+        """
+        time = state.getTime().value_in_unit(picoseconds)
+        step = simulation.currentStep
+
+        if self._append:
+            if self._restartStep is None:
+                self._restartStep = step
+            self._resume(simulation, self._restartStep)
+            self._append = False
+        if self._lastStep is not None and step <= self._lastStep:
+            # this frame is already in the trajectory we're appending to
+            return
+
+        if self._dcd is None or self._needsRollover(time):
+            self._openSegment(simulation, step, time)
+
+        a, b, c = state.getPeriodicBoxVectors()
+        unitCell = mm.Vec3(a[0].value_in_unit(nanometer), b[1].value_in_unit(nanometer),
+                           c[2].value_in_unit(nanometer)) * nanometer
+        self._dcd.writeModel(state.getPositions(), unitCell, step=step, time=time)
+
+        if self._isSegmented:
+            segment = self._segments[-1]
+            segment['lastStep'] = step
+            segment['lastTime'] = time
+            segment['numFrames'] = self._dcd.modelCount
+            writeManifest(self._manifestFile, self._segments)
+
+    def _resume(self, simulation, step):
+        """Reopen the existing trajectory, discarding the frames after the
+        restart step"""
+
+        if self._isSegmented:
+            self._segments = [s for s in self._segments if s['firstStep'] <= step]
+            if len(self._segments) > 0:
+                segment = self._segments[-1]
+                if segment['lastStep'] > step:
+                    fileName = os.path.join(os.path.dirname(self._fileName), segment['file'])
+                    self._openFile(fileName, append=True)
+                    self._dcd = DCDFile(self._out, simulation.topology, simulation.integrator.getStepSize(),
+                                        append=True, index=self._index)
+                    self._dcd.truncate(step)
+                    dcd = self._dcd
+                    self.close()
+                    if segment['lastStep'] > segment['firstStep']:
+                        fraction = float(dcd.lastStep - segment['firstStep']) / (segment['lastStep'] - segment['firstStep'])
+                        segment['lastTime'] = segment['firstTime'] + fraction * (segment['lastTime'] - segment['firstTime'])
+                    segment['lastStep'] = dcd.lastStep
+                    segment['numFrames'] = dcd.modelCount
+                self._lastStep = segment['lastStep']
+            writeManifest(self._manifestFile, self._segments)
+
+        elif os.path.exists(self._fileName):
+            self._openFile(self._fileName, append=True)
+            self._dcd = DCDFile(self._out, simulation.topology, simulation.integrator.getStepSize(),
+                                append=True, index=self._index)
+            self._dcd.truncate(step)
+            self._lastStep = self._dcd.lastStep
+
+    def _needsRollover(self, time):
+        "Should the next frame go in a new segment?"
+        if not self._isSegmented or self._dcd.modelCount == 0:
+            return False
+        if self._segmentSize > 0 and self._dcd.fileSize + self._dcd.frameSize > self._segmentSize:
+            return True
+        if self._segmentTime > 0 and time - self._segmentStartTime >= self._segmentTime:
+            return True
+        return False
+
+    def _openSegment(self, simulation, step, time):
+        "Close the current file (if any) and start writing a new one"
+        self.close()
+
+        if self._isSegmented:
+            fileName = segmentFileName(self._fileName, len(self._segments) + 1)
+            self._segments.append({'file': os.path.basename(fileName),
+                                   'firstStep': step, 'lastStep': step,
+                                   'firstTime': time, 'lastTime': time,
+                                   'numFrames': 0})
+            self._segmentStartTime = time
+        else:
+            fileName = self._fileName
+
+        self._openFile(fileName)
+        self._dcd = DCDFile(self._out, simulation.topology, simulation.integrator.getStepSize(),
+                            step, self._reportInterval, index=self._index)
+
+    def _openFile(self, fileName, append=False):
+        "Open a trajectory file and its index"
+        self._out = open(fileName, 'r+b' if append else 'wb')
+        index = indexFileName(fileName)
+        self._index = open(index, 'r+b' if append and os.path.exists(index) else 'w+b')
+
+    def close(self):
+        "Close the file currently being written to"
+        if self._out is not None:
+            self._out.close()
+            self._index.close()
+            self._out = None
+            self._index = None
+            self._dcd = None
+
+    def __del__(self):
+        self.close()
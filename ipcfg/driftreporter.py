@@ -0,0 +1,291 @@
+"""Monitoring the drift in the total energy of constant energy simulations
+
+Without a thermostat, the total energy should be conserved, and the rate
+at which it drifts is the best cheap measure of whether the timestep is
+too large. DriftEstimator fits a line to the total energy as a function of
+time, keeping only running sums so that it uses constant memory however
+long the simulation is. The drift is reported per nanosecond and per
+degree of freedom, so that it can be compared between systems.
+
+DriftReporter samples the energy of a running Simulation, and
+findLargestTimestep() uses short runs to find the largest timestep whose
+drift is acceptable. The energy of a short run fluctuates a lot, so each
+timestep is run several times, for the same simulated time, and a timestep
+is only accepted when the drift is below the threshold by at least twice
+the standard error of the estimate.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import math
+
+# openmm
+import simtk.openmm as mm
+from simtk.unit import nanoseconds, picoseconds, femtoseconds, kilojoules_per_mole, dalton, kelvin
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['DriftEstimator', 'DriftReporter', 'degreesOfFreedom', 'measureDrift',
+           'findLargestTimestep', 'DEFAULT_TIMESTEPS']
+
+# Candidate timesteps, in fs
+DEFAULT_TIMESTEPS = [0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 5.0, 6.0]
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+
+def degreesOfFreedom(system):
+    "The number of degrees of freedom of a System"
+    dof = 0
+    for i in range(system.getNumParticles()):
+        if system.getParticleMass(i) > 0 * dalton:
+            dof += 3
+    for i in range(system.getNumConstraints()):
+        p1, p2, distance = system.getConstraintParameters(i)
+        if system.getParticleMass(p1) > 0 * dalton or system.getParticleMass(p2) > 0 * dalton:
+            dof -= 1
+    if any(isinstance(f, mm.CMMotionRemover) for f in system.getForces()):
+        dof -= 3
+    return dof
+
+
+def _totalEnergy(state):
+    energy = state.getPotentialEnergy() + state.getKineticEnergy()
+    return energy.value_in_unit(kilojoules_per_mole)
+
+
+def measureDrift(context, numSteps=5000, interval=25, equilibrationSteps=1000):
+    """Run a Context and measure the drift in its total energy.
+
+    Parameters:
+     - context (Context) The context to run, with the positions and
+       velocities set
+     - numSteps (int) The number of steps to sample the energy over
+     - interval (int) The number of steps between energy samples
+     - equilibrationSteps (int) The number of steps to run before sampling,
+       so that the kinetic and potential energy have settled after the
+       velocities were assigned
+    Returns: A tuple (drift, error) of the drift in kJ/mol/ns per degree of
+    freedom, and its standard error. Both are infinite if the simulation
+    blew up.
+    """
+    blewUp = (float('inf'), float('inf'))
+    integrator = context.getIntegrator()
+    estimator = DriftEstimator(degreesOfFreedom(context.getSystem()))
+    try:
+        if equilibrationSteps > 0:
+            integrator.step(equilibrationSteps)
+        for i in range(numSteps // interval + 1):
+            if i > 0:
+                integrator.step(interval)
+            state = context.getState(getEnergy=True)
+            energy = _totalEnergy(state)
+            if math.isnan(energy) or math.isinf(energy):
+                return blewUp
+            estimator.add(state.getTime().value_in_unit(nanoseconds), energy)
+    except Exception:
+        # The platforms raise an exception when the coordinates become NaN
+        return blewUp
+    return estimator.drift(), estimator.driftError()
+
+
+def findLargestTimestep(system, positions, createIntegrator, platform, properties=None,
+                        timesteps=DEFAULT_TIMESTEPS, maxDrift=0.1, temperature=300*kelvin,
+                        boxVectors=None, sampleTime=10*picoseconds, numRuns=3, log=None):
+    """Find the largest timestep for which a constant energy simulation
+    conserves energy well enough.
+
+    The timesteps are tried from the smallest up. Each one is run numRuns
+    times from the same positions, with a different set of random
+    velocities each time (the same sets for every timestep), and the drift
+    is the mean over the runs. A timestep is acceptable only if the drift
+    plus twice its standard error is within maxDrift. The search stops at
+    the first timestep that isn't, so every smaller timestep has passed.
+
+    Parameters:
+     - system (System) The system to run
+     - positions (list) The positions of the particles, which should be
+       minimized
+     - createIntegrator (callable) Creates the integrator for a timestep
+     - platform (Platform) The platform to run on
+     - properties (dict) The platform properties, or None
+     - timesteps (list of float) The candidate timesteps, in fs
+     - maxDrift (float) The largest acceptable drift, in kJ/mol/ns per
+       degree of freedom. Its magnitude is compared, since numerical error
+       can make the energy drift down as well as up.
+     - temperature (temperature) The temperature of the initial velocities
+     - boxVectors (tuple) The periodic box vectors, if they differ from the
+       default ones in the System
+     - sampleTime (time) The simulated time to sample the energy over, in
+       each run
+     - numRuns (int) The number of runs of each timestep
+     - log (Logger) If given, the drift for each timestep is logged to it
+    Returns: A tuple (best, results). best is the largest acceptable
+    timestep in fs, or None if there was none, and results is a list of
+    (timestep, drift, error, acceptable) for every timestep that was tried.
+    """
+    best = None
+    results = []
+    for dt in sorted(timesteps):
+        numSteps = int(round(sampleTime / (dt * femtoseconds)))
+        drifts, errors = [], []
+        for run in range(numRuns):
+            integrator = createIntegrator(dt * femtoseconds)
+            if properties is None:
+                context = mm.Context(system, integrator, platform)
+            else:
+                context = mm.Context(system, integrator, platform, properties)
+            if boxVectors is not None:
+                context.setPeriodicBoxVectors(*boxVectors)
+            context.setPositions(positions)
+            context.setVelocitiesToTemperature(temperature, run + 1)
+            runDrift, runError = measureDrift(context, numSteps)
+            del context, integrator
+            drifts.append(runDrift)
+            errors.append(runError)
+            if math.isinf(runDrift):
+                break
+
+        drift = sum(drifts) / len(drifts)
+        # The standard error of the mean, from the spread between the runs if
+        # that is larger than the fits suggest
+        error = math.sqrt(sum(e**2 for e in errors)) / len(errors)
+        if len(drifts) > 1 and not math.isinf(drift):
+            spread = math.sqrt(sum((d - drift)**2 for d in drifts) / (len(drifts) - 1) / len(drifts))
+            error = max(error, spread)
+
+        acceptable = abs(drift) + 2 * error <= maxDrift
+        results.append((dt, drift, error, acceptable))
+        if log is not None:
+            log.info('dt %g fs: energy drift %.4g +/- %.2g kJ/mol/ns/dof%s'
+                     % (dt, drift, error, '' if acceptable else ', too large'))
+        if not acceptable:
+            break
+        best = dt
+    return best, results
+
+#-----------------------------------------------------------------------------
+# Classes
+#-----------------------------------------------------------------------------
+
+class DriftEstimator(object):
+    """A running least squares fit of the total energy against time.
+    """
+
+    def __init__(self, numDof):
+        """Create a DriftEstimator.
+
+        Parameters:
+         - numDof (int) The number of degrees of freedom of the system
+        """
+        self.numDof = max(numDof, 1)
+        self.count = 0
+        self._sumT = self._sumE = self._sumTT = self._sumTE = self._sumEE = 0.0
+        self._t0 = self._e0 = None
+
+    def add(self, time, energy):
+        """Add a sample.
+
+        Parameters:
+         - time (float) The simulation time, in ns
+         - energy (float) The total energy, in kJ/mol
+        """
+        # Shift the origin to the first sample, so the sums don't lose
+        # precision to the large absolute energy
+        if self._t0 is None:
+            self._t0, self._e0 = time, energy
+        t, e = time - self._t0, energy - self._e0
+        self.count += 1
+        self._sumT += t
+        self._sumE += e
+        self._sumTT += t * t
+        self._sumTE += t * e
+        self._sumEE += e * e
+
+    def drift(self):
+        """The fitted drift in kJ/mol/ns per degree of freedom, or None if
+        there aren't enough samples yet"""
+        if self.count < 2:
+            return None
+        denominator = self.count * self._sumTT - self._sumT**2
+        if denominator <= 0:
+            return None
+        slope = (self.count * self._sumTE - self._sumT * self._sumE) / denominator
+        return slope / self.numDof
+
+    def driftError(self):
+        """The standard error of the fitted drift, in the same units, or None
+        if there aren't enough samples yet. The samples are correlated, so
+        this somewhat underestimates the real uncertainty."""
+        if self.count < 3:
+            return None
+        n = self.count
+        sxx = self._sumTT - self._sumT**2 / n
+        if sxx <= 0:
+            return None
+        sxy = self._sumTE - self._sumT * self._sumE / n
+        syy = self._sumEE - self._sumE**2 / n
+        residual = max(syy - sxy**2 / sxx, 0.0)
+        return math.sqrt(residual / (n - 2) / sxx) / self.numDof
+
+
+class DriftReporter(object):
+    """Reporter that samples the total energy of a Simulation, for
+    estimating its drift. It doesn't write anything itself; the estimate is
+    read with drift().
+    """
+
+    def __init__(self, reportInterval):
+        """Create a DriftReporter.
+
+        Parameters:
+         - reportInterval (int) The interval (in time steps) at which to
+           sample the energy
+        """
+        self._reportInterval = reportInterval
+        self._estimator = None
+
+    def describeNextReport(self, simulation):
+        """Get information about the next report this object will generate.
+
+        Parameters:
+         - simulation (Simulation) The Simulation to generate a report for
+        Returns: A five element tuple.  The first element is the number of steps until the
+        next report.  The remaining elements specify whether that report will require
+        positions, velocities, forces, and energies respectively.
+        """
+        steps = self._reportInterval - simulation.currentStep % self._reportInterval
+        return (steps, False, False, False, True)
+
+    def report(self, simulation, state):
+        """Sample the energy.
+
+        Parameters:
+         - simulation (Simulation) The Simulation to generate a report for
+         - state (State) The current state of the simulation
+        """
+        if self._estimator is None:
+            self._estimator = DriftEstimator(degreesOfFreedom(simulation.system))
+        self._estimator.add(state.getTime().value_in_unit(nanoseconds), _totalEnergy(state))
+
+    def drift(self):
+        """The drift in kJ/mol/ns per degree of freedom so far, or None if
+        there aren't enough samples yet"""
+        if self._estimator is None:
+            return None
+        return self._estimator.drift()
+
+    def driftError(self):
+        """The standard error of the drift so far, or None if there aren't
+        enough samples yet"""
+        if self._estimator is None:
+            return None
+        return self._estimator.driftError()
+
+    def numSamples(self):
+        "The number of energy samples so far"
+        return 0 if self._estimator is None else self._estimator.count
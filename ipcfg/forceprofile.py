@@ -0,0 +1,125 @@
+"""Profiling the cost of each Force in a System
+
+profileForces() puts each Force of a System in its own force group (and
+the reciprocal space part of a PME or Ewald NonbondedForce in another), and
+times repeated force evaluations of each group on its own, so that it's
+clear which terms dominate a step. The time to evaluate an empty group is
+measured too. It is an overhead that every evaluation pays, so it is
+subtracted from the time of each group, and reported on its own.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import time
+
+# openmm
+import simtk.openmm as mm
+from simtk.unit import femtoseconds
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['profileForces', 'OVERHEAD']
+
+# OpenMM supports 32 force groups
+NUM_GROUPS = 32
+
+# Label of the time to evaluate an empty force group
+OVERHEAD = '(overhead)'
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+
+def _timeGroup(context, group, numEvaluations, minTime):
+    "Seconds per force evaluation of one force group"
+    mask = 1 << group
+    context.getState(getForces=True, groups=mask)
+    count = 0
+    start = time.time()
+    while count < numEvaluations:
+        context.getState(getForces=True, groups=mask)
+        count += 1
+        if time.time() - start >= minTime:
+            break
+    return (time.time() - start) / count
+
+
+def _labels(forces):
+    "Names for the forces, numbered when a class appears more than once"
+    names = [f.__class__.__name__ for f in forces]
+    labels = []
+    for i, name in enumerate(names):
+        if names.count(name) > 1:
+            name = '%s #%d' % (name, names[:i].count(name) + 1)
+        labels.append(name)
+    return labels
+
+
+def profileForces(system, positions, platform, properties=None, boxVectors=None,
+                  numEvaluations=100, minTime=1.0):
+    """Time the evaluation of each Force in a System.
+
+    Parameters:
+     - system (System) The system to profile. The force groups of its
+       forces are changed during the profile, and restored afterwards.
+     - positions (list) The positions of the particles
+     - platform (Platform) The platform to time the forces on
+     - properties (dict) The platform properties, or None
+     - boxVectors (tuple) The periodic box vectors, if they differ from the
+       default ones in the System
+     - numEvaluations (int) The maximum number of evaluations of each group
+     - minTime (float) Stop timing a group once this many seconds have been
+       spent on it
+    Returns: A list of (label, force, secondsPerEvaluation), slowest first.
+    force is the Force object, or None for OVERHEAD. The time of each force
+    is net of the overhead, which is the time of OVERHEAD. The reciprocal space
+    part of a NonbondedForce is listed separately, with the label suffix
+    " (reciprocal space)".
+    """
+    forces = [system.getForce(i) for i in range(system.getNumForces())]
+    labels = _labels(forces)
+    originalGroups = [f.getForceGroup() for f in forces]
+    originalReciprocal = dict((i, f.getReciprocalSpaceForceGroup()) for i, f in enumerate(forces)
+                              if isinstance(f, mm.NonbondedForce))
+
+    # (label, force, group) of each group to time
+    groups = []
+    try:
+        for i, force in enumerate(forces):
+            if len(groups) >= NUM_GROUPS - 1:
+                raise ValueError('The system has too many forces to give each its own force group')
+            force.setForceGroup(len(groups))
+            groups.append((labels[i], force, len(groups)))
+            if (isinstance(force, mm.NonbondedForce) and
+                    force.getNonbondedMethod() in [mm.NonbondedForce.Ewald, mm.NonbondedForce.PME]):
+                if len(groups) >= NUM_GROUPS - 1:
+                    raise ValueError('The system has too many forces to give each its own force group')
+                force.setReciprocalSpaceForceGroup(len(groups))
+                groups.append((labels[i] + ' (reciprocal space)', force, len(groups)))
+        groups.append((OVERHEAD, None, len(groups)))
+
+        integrator = mm.VerletIntegrator(1*femtoseconds)
+        if properties is None:
+            context = mm.Context(system, integrator, platform)
+        else:
+            context = mm.Context(system, integrator, platform, properties)
+        if boxVectors is not None:
+            context.setPeriodicBoxVectors(*boxVectors)
+        context.setPositions(positions)
+
+        results = [(label, force, _timeGroup(context, group, numEvaluations, minTime))
+                   for label, force, group in groups]
+        del context, integrator
+        overhead = results[-1][2]
+        results = [(label, force, seconds if force is None else max(seconds - overhead, 0.0))
+                   for label, force, seconds in results]
+    finally:
+        for force, group in zip(forces, originalGroups):
+            force.setForceGroup(group)
+        for i, group in originalReciprocal.items():
+            forces[i].setReciprocalSpaceForceGroup(group)
+
+    return sorted(results, key=lambda r: -r[2])
@@ -0,0 +1,62 @@
+"""Hydrogen mass repartitioning
+
+The fastest motions in a biomolecular system are those of the hydrogens,
+and they limit the timestep. Moving mass from each heavy atom to the
+hydrogens bonded to it slows those motions down without changing the total
+mass of each molecule, or its equilibrium properties, so that (with the
+bonds to hydrogen constrained) a 4 fs timestep is stable.
+
+Water is left alone, since it is usually rigid, and its hydrogens don't
+limit the timestep.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# openmm
+from simtk.unit import amu, is_quantity
+from simtk.openmm.app import element
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['repartitionHydrogenMass']
+
+# Residue names of water, whose hydrogens keep their masses
+WATER_RESIDUES = ['HOH', 'WAT', 'SOL', 'H2O', 'TIP3', 'TIP4', 'TIP5', 'SPC']
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+
+def repartitionHydrogenMass(system, topology, hydrogenMass):
+    """Set the mass of every hydrogen bonded to a heavy atom, taking the
+    extra mass from the heavy atom.
+
+    Parameters:
+     - system (System) The system, whose particle masses are changed
+     - topology (Topology) The topology of the system, including its bonds
+     - hydrogenMass (mass) The new mass of the hydrogens
+    Returns: The number of hydrogens that were changed
+    """
+    if not is_quantity(hydrogenMass):
+        hydrogenMass = hydrogenMass * amu
+
+    count = 0
+    for atom1, atom2 in topology.bonds():
+        if atom1.element is element.hydrogen:
+            atom1, atom2 = atom2, atom1
+        if atom2.element is not element.hydrogen or atom1.element in (element.hydrogen, None):
+            continue
+        if atom2.residue.name in WATER_RESIDUES:
+            continue
+
+        transfer = hydrogenMass - system.getParticleMass(atom2.index)
+        heavyMass = system.getParticleMass(atom1.index) - transfer
+        if heavyMass <= 0 * amu:
+            raise ValueError('Repartitioning the hydrogen mass would leave atom %d (%s) '
+                             'with a mass of %s' % (atom1.index, atom1.name, heavyMass))
+        system.setParticleMass(atom2.index, hydrogenMass)
+        system.setParticleMass(atom1.index, heavyMass)
+        count += 1
+    return count
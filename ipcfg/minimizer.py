@@ -0,0 +1,83 @@
+"""Local energy minimization with a periodic energy readout
+
+LocalEnergyMinimizer runs to convergence (or to an iteration limit) in a
+single call, without any indication of how it is doing. To print the
+energy as it goes, minimizeEnergy() calls it repeatedly, running at most
+reportInterval iterations each time. Each call starts the L-BFGS search
+afresh, so the minimization is considered converged once a chunk of
+iterations lowers the energy by less than a separate threshold. The
+tolerance of the minimizer says how small the gradient must be, not how
+much the energy should change, so it isn't used for this. The restarts
+mean that the readout changes the minimized structure. Also, a chunk can stop early
+when it converges, and the minimizer doesn't say how many iterations it
+ran, so the iteration counts printed are upper bounds.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import sys
+import time
+
+# openmm
+import simtk.openmm as mm
+from simtk.unit import kilojoules_per_mole, is_quantity
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['minimizeEnergy']
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+
+def _potentialEnergy(context):
+    "The potential energy of the context, in kJ/mol"
+    state = context.getState(getEnergy=True)
+    return state.getPotentialEnergy().value_in_unit(kilojoules_per_mole)
+
+
+def minimizeEnergy(context, tolerance=10*kilojoules_per_mole, maxIterations=0,
+                   reportInterval=0, reportThreshold=1*kilojoules_per_mole, file=sys.stdout):
+    """Minimize the energy of a context, optionally printing the potential
+    energy as it goes.
+
+    Parameters:
+     - context (Context) The context to minimize
+     - tolerance (energy) How precisely the energy minimum must be located
+     - maxIterations (int) The maximum number of iterations to perform. If
+       this is 0, minimization continues until the result converges.
+     - reportInterval (int) The number of iterations between energy readouts.
+       If this is 0, nothing is printed.
+     - reportThreshold (energy) With a readout, minimization stops once the
+       energy falls by less than this between two readouts
+     - file (file) The file to print the energy readout to
+    """
+    if reportInterval <= 0:
+        mm.LocalEnergyMinimizer.minimize(context, tolerance, maxIterations)
+        return
+
+    if is_quantity(reportThreshold):
+        reportThreshold = reportThreshold.value_in_unit(kilojoules_per_mole)
+
+    startTime = time.time()
+    energy = _potentialEnergy(context)
+    print >>file, '%14s %18s %15s %10s' % ('Max iterations', 'P.E. (kJ/mol)', 'Change', 'Time (s)')
+    print >>file, '%14d %18.4f %15s %10.2f' % (0, energy, '', 0.0)
+
+    # The most iterations that can have run so far
+    maxRun = 0
+    while maxIterations <= 0 or maxRun < maxIterations:
+        chunk = reportInterval
+        if maxIterations > 0:
+            chunk = min(chunk, maxIterations - maxRun)
+        mm.LocalEnergyMinimizer.minimize(context, tolerance, chunk)
+        maxRun += chunk
+
+        lastEnergy, energy = energy, _potentialEnergy(context)
+        print >>file, '%14d %18.4f %15.4f %10.2f' % (maxRun, energy, energy - lastEnergy,
+                                                    time.time() - startTime)
+        if lastEnergy - energy < reportThreshold:
+            break
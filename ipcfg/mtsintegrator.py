@@ -0,0 +1,84 @@
+"""A multiple time step (r-RESPA) integrator
+
+The reciprocal space part of PME or Ewald is the most expensive force to
+compute, but it changes slowly, so it doesn't need to be computed every
+step. MTSIntegrator integrates each force group with its own time step,
+computing the slow forces once per (outer) step and the fast ones several
+times, and assignForceGroups() puts the reciprocal space force of a System
+in the slow group and everything else in the fast group.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# openmm
+import simtk.openmm as mm
+from simtk.openmm import CustomIntegrator
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['MTSIntegrator', 'assignForceGroups', 'FAST_GROUP', 'SLOW_GROUP']
+
+# The force groups of the direct space and bonded forces, and of the
+# reciprocal space forces
+FAST_GROUP = 0
+SLOW_GROUP = 1
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+
+def _addSubsteps(integrator, parentSubsteps, groups):
+    group, substeps = groups[0]
+    for i in range(substeps // parentSubsteps):
+        integrator.addComputePerDof("v", "v+0.5*(dt/%d)*f%d/m" % (substeps, group))
+        if len(groups) == 1:
+            integrator.addComputePerDof("x1", "x")
+            integrator.addComputePerDof("x", "x+(dt/%d)*v" % substeps)
+            integrator.addConstrainPositions()
+            integrator.addComputePerDof("v", "(x-x1)/(dt/%d)" % substeps)
+        else:
+            _addSubsteps(integrator, substeps, groups[1:])
+        integrator.addComputePerDof("v", "v+0.5*(dt/%d)*f%d/m" % (substeps, group))
+
+
+def MTSIntegrator(timestep, groups):
+    """Create a multiple time step integrator.
+
+    Parameters:
+     - timestep (time) The outer time step, of the slowest force group
+     - groups (list) (group, substeps) pairs, from the slowest force group to
+       the fastest. substeps is the number of times the group is evaluated
+       per outer step, and each one must be a multiple of the one before it.
+       The first is usually 1.
+    """
+    if len(groups) == 0:
+        raise ValueError('At least one force group must be given')
+    for (_, slower), (_, faster) in zip(groups[:-1], groups[1:]):
+        if faster % slower != 0:
+            raise ValueError('The substeps of each force group must be a multiple '
+                             'of those of the slower group before it')
+
+    integrator = CustomIntegrator(timestep)
+    integrator.addPerDofVariable("x1", 0)
+    integrator.addUpdateContextState()
+    _addSubsteps(integrator, 1, groups)
+    integrator.addConstrainVelocities()
+    return integrator
+
+
+def assignForceGroups(system):
+    """Put the reciprocal space part of the NonbondedForce of a System in
+    SLOW_GROUP, and all of the other forces in FAST_GROUP.
+
+    Returns: Whether there was a reciprocal space force to put in SLOW_GROUP
+    """
+    found = False
+    for force in system.getForces():
+        force.setForceGroup(FAST_GROUP)
+        if (isinstance(force, mm.NonbondedForce) and
+                force.getNonbondedMethod() in [mm.NonbondedForce.Ewald, mm.NonbondedForce.PME]):
+            force.setReciprocalSpaceForceGroup(SLOW_GROUP)
+            found = True
+    return found
@@ -0,0 +1,175 @@
+"""Tuning the nonbonded cutoff and Ewald error tolerance for speed
+
+The cutoff and the Ewald error tolerance trade accuracy for speed, and the
+best tradeoff depends on the system and the platform. tuneNonbonded()
+sweeps a grid of candidate settings for the real system. For each one it
+measures the error in the forces, relative to a reference computed once
+with the largest cutoff and a tight tolerance on the Reference platform,
+and times a short run of the settings that are accurate enough.
+
+The settings are changed on the forces of an existing System, so the
+System doesn't need to be recreated from the force field for each
+candidate. Every force with a cutoff (such as a GBSAOBCForce or a
+CustomNonbondedForce, as well as the NonbondedForce) gets the candidate
+cutoff, just as createSystem() gives them all the same nonbondedCutoff.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# numpy
+import numpy as np
+
+# openmm
+import simtk.openmm as mm
+from simtk.unit import nanometers, femtoseconds, kilojoules_per_mole, dalton, is_quantity
+
+from .benchmark import timeSteps
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['tuneNonbonded', 'DEFAULT_CUTOFFS', 'DEFAULT_TOLERANCES']
+
+# Candidate cutoffs, in nm
+DEFAULT_CUTOFFS = [0.8, 0.9, 1.0, 1.1, 1.2]
+
+# Candidate Ewald error tolerances
+DEFAULT_TOLERANCES = [1e-3, 5e-4, 2e-4, 1e-4]
+
+# Ewald error tolerance of the reference forces
+REFERENCE_TOLERANCE = 1e-6
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+
+def _forces(context):
+    "The forces in a context, as a numpy array in kJ/mol/nm"
+    state = context.getState(getForces=True)
+    return state.getForces(asNumpy=True).value_in_unit(kilojoules_per_mole / nanometers)
+
+
+def _createContext(system, platform, properties, dt, positions, boxVectors):
+    integrator = mm.VerletIntegrator(dt)
+    if properties is None:
+        context = mm.Context(system, integrator, platform)
+    else:
+        context = mm.Context(system, integrator, platform, properties)
+    if boxVectors is not None:
+        context.setPeriodicBoxVectors(*boxVectors)
+    context.setPositions(positions)
+    return context, integrator
+
+
+def _maxCutoff(system, boxVectors):
+    "The largest cutoff (in nm) that the periodic box allows, if any"
+    if boxVectors is None:
+        boxVectors = system.getDefaultPeriodicBoxVectors()
+    sizes = [boxVectors[i][i] for i in range(3)]
+    sizes = [s.value_in_unit(nanometers) if is_quantity(s) else s for s in sizes]
+    return 0.5 * min(sizes)
+
+
+def _cutoffForces(system):
+    "The forces of a System that use a cutoff"
+    return [f for f in system.getForces()
+            if hasattr(f, 'setCutoffDistance') and hasattr(f, 'getNonbondedMethod')
+            and f.getNonbondedMethod() != f.NoCutoff]
+
+
+def tuneNonbonded(system, positions, platform, properties=None, cutoffs=DEFAULT_CUTOFFS,
+                  tolerances=DEFAULT_TOLERANCES, maxForceError=5e-3, dt=2*femtoseconds,
+                  boxVectors=None, log=None):
+    """Find the fastest nonbonded cutoff and Ewald error tolerance for a
+    system, among those that are accurate enough.
+
+    Parameters:
+     - system (System) The system to tune. Its NonbondedForce, and any
+       other forces with a cutoff, are modified during the sweep, and
+       restored afterwards.
+     - positions (list) The positions of the particles
+     - platform (Platform) The platform to time the candidates on
+     - properties (dict) The platform properties, or None
+     - cutoffs (list of float) The candidate cutoffs, in nm
+     - tolerances (list of float) The candidate Ewald error tolerances. They
+       are only used with the Ewald and PME nonbonded methods.
+     - maxForceError (float) The largest acceptable RMS error in the forces,
+       relative to the RMS of the reference forces
+     - dt (time) The time step of the timed runs
+     - boxVectors (tuple) The periodic box vectors, if they differ from the
+       default ones in the System
+     - log (Logger) If given, the result for each candidate is logged to it
+    Returns: A tuple (best, results). best is the (cutoff, tolerance) of the
+    fastest acceptable candidate, or None if there was none. results is a
+    list of (cutoff, tolerance, forceError, secondsPerStep) for every
+    candidate, with secondsPerStep None for those that were too inaccurate.
+    """
+    nonbonded = [f for f in system.getForces() if isinstance(f, mm.NonbondedForce)]
+    if len(nonbonded) != 1:
+        raise ValueError('The system must have exactly one NonbondedForce to tune')
+    nonbonded = nonbonded[0]
+    method = nonbonded.getNonbondedMethod()
+    if method == mm.NonbondedForce.NoCutoff:
+        raise ValueError('There is no cutoff to tune with the NoCutoff nonbonded method')
+    usesEwald = method in [mm.NonbondedForce.Ewald, mm.NonbondedForce.PME]
+    if not usesEwald:
+        tolerances = [None]
+
+    cutoffForces = _cutoffForces(system)
+    originalCutoffs = [f.getCutoffDistance() for f in cutoffForces]
+    if any(c != nonbonded.getCutoffDistance() for c in originalCutoffs):
+        raise ValueError('The forces with a cutoff must all have the same cutoff to tune it')
+    if any(getattr(f, 'getUseSwitchingFunction', lambda: False)() for f in cutoffForces):
+        raise ValueError('The cutoff cannot be tuned for forces that use a switching function')
+
+    if method != mm.NonbondedForce.CutoffNonPeriodic:
+        cutoffs = [c for c in cutoffs if c < _maxCutoff(system, boxVectors)]
+        if len(cutoffs) == 0:
+            raise ValueError('All of the candidate cutoffs are too large for the periodic box')
+
+    originalTolerance = nonbonded.getEwaldErrorTolerance()
+    # Forces on massless particles (virtual sites) are not meaningful
+    weights = np.array([system.getParticleMass(i).value_in_unit(dalton) > 0
+                        for i in range(system.getNumParticles())])
+
+    results = []
+    try:
+        for force in cutoffForces:
+            force.setCutoffDistance(max(cutoffs) * nanometers)
+        nonbonded.setEwaldErrorTolerance(REFERENCE_TOLERANCE)
+        context, integrator = _createContext(system, mm.Platform.getPlatformByName('Reference'),
+                                             None, dt, positions, boxVectors)
+        reference = _forces(context)[weights]
+        referenceNorm = np.sqrt(np.mean(np.sum(reference**2, axis=1)))
+        del context, integrator
+
+        for cutoff in cutoffs:
+            for tolerance in tolerances:
+                for force in cutoffForces:
+                    force.setCutoffDistance(cutoff * nanometers)
+                if tolerance is not None:
+                    nonbonded.setEwaldErrorTolerance(tolerance)
+                context, integrator = _createContext(system, platform, properties, dt, positions, boxVectors)
+                error = _forces(context)[weights] - reference
+                error = np.sqrt(np.mean(np.sum(error**2, axis=1))) / referenceNorm
+                timing = None
+                if error <= maxForceError:
+                    timing = timeSteps(context)
+                del context, integrator
+
+                results.append((cutoff, tolerance, error, timing))
+                if log is not None:
+                    log.info('cutoff %.2f nm, ewald_tol %s: force error %.2e, %s' % (
+                        cutoff, tolerance, error, 'too inaccurate' if timing is None
+                        else '%.3f ms/step' % (1000 * timing)))
+    finally:
+        for force, original in zip(cutoffForces, originalCutoffs):
+            force.setCutoffDistance(original)
+        nonbonded.setEwaldErrorTolerance(originalTolerance)
+
+    acceptable = [r for r in results if r[3] is not None]
+    if len(acceptable) == 0:
+        return None, results
+    fastest = min(acceptable, key=lambda r: r[3])
+    return (fastest[0], fastest[1]), results
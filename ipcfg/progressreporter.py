@@ -14,12 +14,15 @@ from simtk.openmm.app import StateDataReporter
 #-----------------------------------------------------------------------------
 
 class ProgressReporter(StateDataReporter):
-    def __init__(self, file, reportInterval, totalSteps):
+    def __init__(self, file, reportInterval, totalSteps, driftReporter=None):
         super(ProgressReporter, self).__init__(file, reportInterval, step=False, time=True,
             potentialEnergy=True, kineticEnergy=True, totalEnergy=True,
             temperature=True)
 
         self._totalSteps = totalSteps
+        # If given, a DriftReporter whose estimate of the energy drift is
+        # shown in an extra column
+        self._driftReporter = driftReporter
 
     def _initializeConstants(self, simulation, state):
         if simulation.topology.getUnitCellDimensions() is not None:
@@ -52,6 +55,9 @@ class ProgressReporter(StateDataReporter):
 
         values = [progressPercent, self.pretty_time(timeLeft), rate] + \
                  super(ProgressReporter, self)._constructReportValues(simulation, state)
+        if self._driftReporter is not None:
+            drift = self._driftReporter.drift()
+            values.append(float('nan') if drift is None else drift)
         return values
 
     def _constructHeaders(self):
@@ -78,6 +84,10 @@ class ProgressReporter(StateDataReporter):
             headers.append(('Rho', '(g/mL)'))
             formats.append('%10.4f')
             widths.append(10)
+        if self._driftReporter is not None:
+            headers.append(('Drift', '(kJ/mol/ns/dof)'))
+            formats.append('%16.4g')
+            widths.append(16)
 
         self._formats = formats
 
@@ -13,12 +13,14 @@ import simtk.openmm as mm
 from simtk.unit import (nanometer, picosecond, dalton, Quantity,
                         kilojoules_per_mole)
 
+from .compressedfile import file_type
+
 
 #-----------------------------------------------------------------------------
 # Globals
 #-----------------------------------------------------------------------------
 
-__all__ = ['RestartReporter', 'loadRestartFile']
+__all__ = ['RestartReporter', 'loadRestartFile', 'readRestartFile']
 
 class NotSpecified(object):
     def __str__(self):
@@ -27,23 +29,6 @@ NotSpecified = NotSpecified()
 
 RESTART_FORMAT_VERSION = 2.0
 
-# File signatures http://www.garykessler.net/library/file_sigs.html
-magic_dict = {
-    "\x1f\x8b\x08": "gz",
-    "\x42\x5a\x68": "bz2",
-    "\x50\x4b\x03\x04": "zip"
-    }
-
-max_len = max(len(x) for x in magic_dict)
-
-def file_type(filename):
-    with open(filename) as f:
-        file_start = f.read(max_len)
-    for magic, filetype in magic_dict.items():
-        if file_start.startswith(magic):
-            return filetype
-    return "no match"
-
 #-----------------------------------------------------------------------------
 # Utilities
 #-----------------------------------------------------------------------------
@@ -219,17 +204,12 @@ class RestartReporter(object):
 # Functions
 #-----------------------------------------------------------------------------
 
-def loadRestartFile(simulation, fileName, isLeapFrog=NotSpecified):
-    """Populate a simulation with data from a restart file.
+def readRestartFile(fileName):
+    """Read the contents of a restart file, without loading them into a
+    simulation.
 
-   Parameters:
-    - simulation (Simulation) The Simulation to populate.
-    - fileName (State) The file to read from, specified as a file name.
-    - isLeapFrog (bool) Flag indicating whether the simulation uses a leapfrog
-      style integrator, in which the velocities are offset from the positions
-      by 1/2 a timestep. If so, the velocities will be advanced after loading.
-      If not specified, we will inspect the integrator and attempt to make that
-      determination automatically.
+    Returns: A dict with the fields 'positions', 'boxVectors', 'velocities'
+    (in nm and nm/ps), 'time', 'step' and 'parameters'.
     """
     if file_type(fileName) == 'bz2':
         f = bz2.BZ2File(fileName)
@@ -241,11 +221,27 @@ def loadRestartFile(simulation, fileName, isLeapFrog=NotSpecified):
     if 'version' not in data or data['version'] != RESTART_FORMAT_VERSION:
         raise ValueError("I don't know how to read this restart file.")
 
-    numParticles = simulation.context.getSystem().getNumParticles()
     fields = ['positions', 'boxVectors', 'velocities', 'time', 'step', 'parameters']
     for field in fields:
         if field not in data:
             raise KeyError('Restart file "%s" does not contain %s' % (fileName, field))
+    return data
+
+
+def loadRestartFile(simulation, fileName, isLeapFrog=NotSpecified):
+    """Populate a simulation with data from a restart file.
+
+   Parameters:
+    - simulation (Simulation) The Simulation to populate.
+    - fileName (State) The file to read from, specified as a file name.
+    - isLeapFrog (bool) Flag indicating whether the simulation uses a leapfrog
+      style integrator, in which the velocities are offset from the positions
+      by 1/2 a timestep. If so, the velocities will be advanced after loading.
+      If not specified, we will inspect the integrator and attempt to make that
+      determination automatically.
+    """
+    data = readRestartFile(fileName)
+    numParticles = simulation.context.getSystem().getNumParticles()
 
     # set positions
     numPositions = len(data['positions'])
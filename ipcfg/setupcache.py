@@ -0,0 +1,323 @@
+"""Cache for the results of expensive simulation setup steps
+
+Setting up a large simulation can take minutes before the first step,
+mostly spent building the System from the force field and parsing large
+coordinate files in pure python. SetupCache keeps the results of these
+steps in a directory, each stored under a hash of
+everything that it depends on: the contents of the input files, the options
+that were used, and the version of OpenMM. Later runs with identical inputs
+find the result in the cache instead of recomputing it.
+
+Entries are never invalidated explicitly, since a change to any of the
+inputs produces a different key. The cache directory can be deleted at any
+time.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import io
+import os
+import shutil
+import hashlib
+import tempfile
+
+# numpy
+import numpy as np
+
+# openmm
+import simtk.openmm as mm
+from simtk.openmm import app
+from simtk.unit import nanometer, Quantity
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['SetupCache', 'CachedCoordinates', 'hashFile', 'loadCoordinates',
+           'saveCoordinates', 'gromacsIncludeFiles']
+
+# Where GromacsTopFile looks for included files by default
+GROMACS_INCLUDE_DIR = '/usr/local/gromacs/share/gromacs/top'
+
+# Bump this when the layout of the cache entries changes
+CACHE_FORMAT_VERSION = 1
+
+#-----------------------------------------------------------------------------
+# Utilities
+#-----------------------------------------------------------------------------
+
+def hashFile(fileName, hash=None):
+    """Hash the contents of a file.
+
+    Parameters:
+     - fileName (string) The file to hash
+     - hash (hashlib hash object) If supplied, the contents are added to
+       this hash, instead of a new one.
+    Returns: The hash object
+    """
+    if hash is None:
+        hash = hashlib.sha1()
+    with open(fileName, 'rb') as f:
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                break
+            hash.update(block)
+    return hash
+
+
+def writeAtomically(fileName, data, mode='wb'):
+    """Write data to a file such that readers never see a partially written
+    file, by writing to a temporary file and then moving it into place.
+    """
+    tmp_fd, tmp_fn = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fileName)))
+    try:
+        with os.fdopen(tmp_fd, mode) as f:
+            f.write(data)
+        try:
+            shutil.move(tmp_fn, fileName)
+        except OSError:
+            # On windows, OSError will be raised if the file exists
+            os.remove(fileName)
+            shutil.move(tmp_fn, fileName)
+    finally:
+        if os.path.exists(tmp_fn):
+            os.remove(tmp_fn)
+
+
+def gromacsIncludeFiles(fileName, includeDir=GROMACS_INCLUDE_DIR):
+    """Find the files that a Gromacs topology file includes, directly or
+    indirectly, the same way GromacsTopFile looks for them: next to the
+    including file, and then in includeDir.
+
+    Every #include is followed, whether or not it is inside an #ifdef that
+    is active, so the list may contain files that GromacsTopFile doesn't
+    read. Includes that can't be found are left out.
+
+    Returns: A list of the paths of the included files
+    """
+    found = []
+    pending = [fileName]
+    while len(pending) > 0:
+        current = pending.pop(0)
+        with open(current) as f:
+            for line in f:
+                line = line.strip()
+                if not line.startswith('#include'):
+                    continue
+                name = line[len('#include'):].strip().strip('"<>')
+                for directory in [os.path.dirname(current), includeDir]:
+                    path = os.path.join(directory, name)
+                    if os.path.isfile(path):
+                        if path not in found:
+                            found.append(path)
+                            pending.append(path)
+                        break
+    return found
+
+
+def _stringArray(values):
+    "A numpy array of strings, which is also correct when there are none"
+    return np.array([str(v) for v in values], dtype=str)
+
+
+def saveCoordinates(fileName, positions, topology=None, unitCellDimensions=None):
+    """Save positions, and optionally a topology and unit cell, in a compact
+    binary (numpy .npz) file.
+
+    The topology is stored as tables of chains, residues, atoms and bonds,
+    with the residues pointing to their chain and the atoms pointing to their
+    residue by index.
+
+    Parameters:
+     - fileName (string) The file to write
+     - positions (list) The positions of the atoms
+     - topology (Topology) The topology, if any
+     - unitCellDimensions (Vec3) The dimensions of the unit cell, if any
+    """
+    arrays = {'positions': np.array(positions.value_in_unit(nanometer), dtype=np.float64).reshape(-1, 3)}
+    if unitCellDimensions is not None:
+        arrays['unitCell'] = np.array(unitCellDimensions.value_in_unit(nanometer), dtype=np.float64)
+
+    if topology is not None:
+        chains = list(topology.chains())
+        residues = list(topology.residues())
+        atoms = list(topology.atoms())
+        chainIndex = dict((c, i) for i, c in enumerate(chains))
+        residueIndex = dict((r, i) for i, r in enumerate(residues))
+        atomIndex = dict((a, i) for i, a in enumerate(atoms))
+
+        arrays['chainIds'] = _stringArray(getattr(c, 'id', '') for c in chains)
+        arrays['residueNames'] = _stringArray(r.name for r in residues)
+        arrays['residueIds'] = _stringArray(getattr(r, 'id', '') for r in residues)
+        arrays['residueChains'] = np.array([chainIndex[r.chain] for r in residues], dtype=np.int32)
+        arrays['atomNames'] = _stringArray(a.name for a in atoms)
+        arrays['atomElements'] = _stringArray('' if a.element is None else a.element.symbol for a in atoms)
+        arrays['atomResidues'] = np.array([residueIndex[a.residue] for a in atoms], dtype=np.int32)
+        arrays['bonds'] = np.array([(atomIndex[a], atomIndex[b]) for a, b in topology.bonds()],
+                                   dtype=np.int32).reshape(-1, 2)
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    writeAtomically(fileName, buffer.getvalue())
+
+
+def loadCoordinates(fileName):
+    """Load positions, topology and unit cell saved with saveCoordinates()
+
+    Returns: A CachedCoordinates object
+    """
+    with np.load(fileName) as data:
+        xyz = data['positions']
+        unitCell = None
+        if 'unitCell' in data.files:
+            unitCell = Quantity(mm.Vec3(*data['unitCell'].tolist()), nanometer)
+
+        topology = None
+        if 'atomNames' in data.files:
+            topology = app.Topology()
+            chains = []
+            for id in data['chainIds'].tolist():
+                chain = topology.addChain()
+                chain.id = id
+                chains.append(chain)
+            residues = []
+            for name, id, chain in zip(data['residueNames'].tolist(), data['residueIds'].tolist(),
+                                       data['residueChains'].tolist()):
+                residue = topology.addResidue(name, chains[chain])
+                residue.id = id
+                residues.append(residue)
+            elements = {'': None}
+            atoms = []
+            for name, symbol, residue in zip(data['atomNames'].tolist(), data['atomElements'].tolist(),
+                                             data['atomResidues'].tolist()):
+                if symbol not in elements:
+                    elements[symbol] = app.element.get_by_symbol(symbol)
+                atoms.append(topology.addAtom(name, elements[symbol], residues[residue]))
+            for a, b in data['bonds'].tolist():
+                topology.addBond(atoms[a], atoms[b])
+            if unitCell is not None:
+                topology.setUnitCellDimensions(unitCell)
+
+    return CachedCoordinates(xyz, topology, unitCell)
+
+#-----------------------------------------------------------------------------
+# Classes
+#-----------------------------------------------------------------------------
+
+class CachedCoordinates(object):
+    """The contents of a coordinate file loaded from the cache, with the same
+    positions, topology and getUnitCellDimensions() attributes as the PDBFile
+    or GromacsGroFile it was read from.
+    """
+
+    def __init__(self, xyz, topology=None, unitCellDimensions=None):
+        """Create a CachedCoordinates object.
+
+        Parameters:
+         - xyz (numpy array) The (numAtoms, 3) positions, in nm
+         - topology (Topology) The topology, or None if the file had none
+         - unitCellDimensions (Vec3) The unit cell, or None
+        """
+        self.xyz = xyz
+        self.topology = topology
+        self._unitCellDimensions = unitCellDimensions
+        self._positions = None
+
+    @property
+    def positions(self):
+        "The positions, as a list of Vec3 like the file readers give"
+        # Built on first use, since it takes much longer than loading xyz
+        if self._positions is None:
+            self._positions = Quantity([mm.Vec3(*p) for p in self.xyz.tolist()], nanometer)
+        return self._positions
+
+    def getUnitCellDimensions(self):
+        "Get the dimensions of the unit cell, or None if there is none"
+        return self._unitCellDimensions
+
+
+class SetupCache(object):
+    """A directory of cached setup results, stored under content hashes.
+    """
+
+    def __init__(self, directory):
+        """Create a SetupCache.
+
+        Parameters:
+         - directory (string) The cache directory. It is created if it
+           doesn't exist.
+        """
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, files, options, data=()):
+        """Compute the key for a cache entry.
+
+        Parameters:
+         - files (list of strings) The input files that the entry depends on.
+           Their contents (not their names) are hashed.
+         - options (object) Any other inputs that the entry depends on. Its
+           repr() is hashed, so it should be a simple type like a list of
+           (name, value) tuples.
+         - data (list of bytes) Inputs that are held in memory rather than
+           in files, such as a serialized System.
+        Returns: The key, as a hex string
+        """
+        hash = hashlib.sha1()
+        hash.update(('%s %s\n' % (CACHE_FORMAT_VERSION, mm.Platform.getOpenMMVersion())).encode('utf-8'))
+        for fn in files:
+            hashFile(fn, hash)
+            hash.update(b'\0')
+        for block in data:
+            hash.update(block)
+            hash.update(b'\0')
+        hash.update(repr(options).encode('utf-8'))
+        return hash.hexdigest()
+
+    def fileName(self, kind, key, ext):
+        "The path of the cache entry of some kind with a given key"
+        return os.path.join(self.directory, '%s-%s%s' % (kind, key, ext))
+
+    def systemFileName(self, key):
+        "The path of the cached System with a given key"
+        return self.fileName('system', key, '.xml')
+
+    def loadSystem(self, key):
+        """Load a System from the cache.
+
+        Returns: The System, or None if there is no System with this key in
+        the cache.
+        """
+        fn = self.systemFileName(key)
+        if not os.path.exists(fn):
+            return None
+        with open(fn) as f:
+            return mm.XmlSerializer.deserializeSystem(f.read())
+
+    def storeSystem(self, key, system):
+        "Store a System in the cache"
+        writeAtomically(self.systemFileName(key),
+                        mm.XmlSerializer.serializeSystem(system), mode='w')
+
+    def coordinatesFileName(self, key):
+        "The path of the cached coordinates with a given key"
+        return self.fileName('coords', key, '.npz')
+
+    def loadCoordinates(self, key):
+        """Load the positions and topology, such as the contents of a
+        coordinate file, from the cache.
+
+        Returns: A CachedCoordinates object, or None if there are no
+        coordinates with this key in the cache.
+        """
+        fn = self.coordinatesFileName(key)
+        if not os.path.exists(fn):
+            return None
+        return loadCoordinates(fn)
+
+    def storeCoordinates(self, key, positions, topology=None, unitCellDimensions=None):
+        "Store positions and optionally a topology and unit cell in the cache"
+        saveCoordinates(self.coordinatesFileName(key), positions, topology, unitCellDimensions)
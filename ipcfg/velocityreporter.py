@@ -0,0 +1,223 @@
+"""Reporter for writing velocity trajectories
+
+The velocities are stored in a simple binary format. The file starts with a
+header containing VELOCITY_MAGIC, the number of atoms and the number of bytes
+per stored value (4 for float32, or 2 for float16). It is followed by one
+fixed-size record per frame, containing the step, the time (in picoseconds)
+and a scale factor, followed by the 3*numAtoms scaled velocity components.
+The velocities in nm/ps are the stored values multiplied by the scale factor,
+which for float16 storage is chosen per frame so that the largest component
+is stored as 1, making the best use of the limited range of half precision
+floats.
+
+For leapfrog integrators, the velocities in the State lag the positions by
+half a timestep. They are advanced to line up with the positions before
+being written, with a vectorized half-step kick, v + 0.5*dt*f/m. Unlike the
+correction applied by the RestartReporter, this doesn't reapply the velocity
+constraints, since doing so requires a round trip through the Context.
+"""
+#-----------------------------------------------------------------------------
+# Imports
+#-----------------------------------------------------------------------------
+# stdlib
+import os
+import struct
+
+# numpy
+import numpy as np
+
+# openmm
+from simtk.unit import nanometer, picosecond, picoseconds, dalton, kilojoules_per_mole
+
+from .restartreporter import NotSpecified, isLeapFrogIntegrator
+
+#-----------------------------------------------------------------------------
+# Globals
+#-----------------------------------------------------------------------------
+
+__all__ = ['VelocityReporter', 'loadVelocityFile']
+
+VELOCITY_MAGIC = b'OMMVEL01'
+HEADER = struct.Struct('<8sii')
+FRAME_HEADER = struct.Struct('<qdd')
+
+PRECISIONS = {'single': np.dtype('<f4'), 'half': np.dtype('<f2')}
+
+#-----------------------------------------------------------------------------
+# Functions
+#-----------------------------------------------------------------------------
+
+def _frameDtype(numAtoms, valueDtype):
+    "Structured numpy dtype of one frame record"
+    return np.dtype([('step', '<i8'), ('time', '<f8'), ('scale', '<f8'),
+                     ('values', valueDtype, (numAtoms, 3))])
+
+
+def _readHeader(file):
+    "Read the header of a velocity file, returning the frame record dtype"
+    data = file.read(HEADER.size)
+    if len(data) != HEADER.size:
+        raise ValueError('File is too short to be a velocity file')
+    magic, numAtoms, valueSize = HEADER.unpack(data)
+    if magic != VELOCITY_MAGIC:
+        raise ValueError('File is not a velocity file (bad magic number)')
+    valueDtype = dict((d.itemsize, d) for d in PRECISIONS.values())[valueSize]
+    return _frameDtype(numAtoms, valueDtype)
+
+
+def loadVelocityFile(fileName):
+    """Read a velocity trajectory written by VelocityReporter.
+
+    Parameters:
+     - fileName (string) The file to read
+    Returns: A tuple (steps, times, velocities). steps and times (in
+    picoseconds) are arrays with one entry per frame, and velocities is a
+    (numFrames, numAtoms, 3) float32 array, in nm/ps.
+    """
+    with open(fileName, 'rb') as f:
+        dtype = _readHeader(f)
+    numFrames = (os.path.getsize(fileName) - HEADER.size) // dtype.itemsize
+    if numFrames == 0:
+        frames = np.zeros(0, dtype=dtype)
+    else:
+        frames = np.memmap(fileName, dtype=dtype, mode='r', offset=HEADER.size, shape=(numFrames,))
+
+    velocities = frames['values'].astype(np.float32)
+    velocities *= frames['scale'].astype(np.float32)[:, np.newaxis, np.newaxis]
+    return np.array(frames['step']), np.array(frames['time']), velocities
+
+#-----------------------------------------------------------------------------
+# Classes
+#-----------------------------------------------------------------------------
+
+class VelocityReporter(object):
+    """VelocityReporter periodically writes the velocities of all of the
+    atoms to a file, in reduced (single or half) precision.
+
+    To use it, create a VelocityReporter, then add it to the Simulation's
+    list of reporters.
+    """
+
+    def __init__(self, fileName, reportInterval, precision='single',
+                 isLeapFrog=NotSpecified, append=False):
+        """Create a VelocityReporter.
+
+        Parameters:
+         - fileName (string) The file to write to
+         - reportInterval (int) The interval (in time steps) at which to write frames
+         - precision (string) 'single' or 'half', the precision of the stored velocities
+         - isLeapFrog (bool) Flag indicating whether the simulation uses a leapfrog
+           style integrator, in which the velocities are offset from the positions
+           by 1/2 a timestep. If so, the velocities will be advanced to match
+           up with the positions before they are written. If not specified,
+           the reporter will inspect the integrator and attempt to make that
+           determination on its own.
+         - append (bool) Continue an existing velocity file, if there is one,
+           discarding any frames past the step the simulation is at before
+           it starts running (the restart step).
+        """
+        self._reportInterval = reportInterval
+        self._fileName = fileName
+        self._valueDtype = PRECISIONS[precision.lower()]
+        self._isLeapFrog = isLeapFrog
+        self._append = append
+        self._restartStep = None
+        self._out = None
+        self._lastStep = None
+        self._invMasses = None
+
+    def _initialize(self, simulation):
+        """Delayed initialization that can only take place once we
+        have access to the simulation object that the reporter is bound to
+        """
+        if self._isLeapFrog == NotSpecified:
+            self._isLeapFrog = isLeapFrogIntegrator(simulation.context.getIntegrator())
+
+        system = simulation.context.getSystem()
+        masses = np.array([system.getParticleMass(i).value_in_unit(dalton)
+                           for i in range(system.getNumParticles())])
+        self._invMasses = np.zeros_like(masses)
+        self._invMasses[masses > 0] = 1.0 / masses[masses > 0]
+        self._frameDtype = _frameDtype(len(masses), self._valueDtype)
+
+        if self._append and os.path.exists(self._fileName):
+            if self._restartStep is None:
+                self._restartStep = simulation.currentStep
+            self._resume(self._restartStep)
+        else:
+            self._out = open(self._fileName, 'wb')
+            self._out.write(HEADER.pack(VELOCITY_MAGIC, len(masses), self._valueDtype.itemsize))
+
+    def _resume(self, restartStep):
+        "Reopen an existing file, discarding the frames after the restart step"
+        self._out = open(self._fileName, 'r+b')
+        if _readHeader(self._out) != self._frameDtype:
+            raise ValueError('Cannot append to %s, since its number of atoms or '
+                             'precision does not match' % self._fileName)
+
+        numFrames = (os.path.getsize(self._fileName) - HEADER.size) // self._frameDtype.itemsize
+        keep = 0
+        for i in range(numFrames):
+            self._out.seek(HEADER.size + i*self._frameDtype.itemsize)
+            step = FRAME_HEADER.unpack(self._out.read(FRAME_HEADER.size))[0]
+            if step > restartStep:
+                break
+            keep = i + 1
+            self._lastStep = step
+        self._out.truncate(HEADER.size + keep*self._frameDtype.itemsize)
+        self._out.seek(0, os.SEEK_END)
+
+    def describeNextReport(self, simulation):
+        """Get information about the next report this object will generate.
+
+        Parameters:
+         - simulation (Simulation) The Simulation to generate a report for
+        Returns: A five element tuple.  The first element is the number of steps until the
+        next report.  The remaining elements specify whether that report will require
+        positions, velocities, forces, and energies respectively.
+        """
+        if self._append and self._restartStep is None:
+            # This is called before the first step is integrated, so the
+            # simulation is still at the step it was restarted from
+            self._restartStep = simulation.currentStep
+        steps = self._reportInterval - simulation.currentStep % self._reportInterval
+        needForces = self._isLeapFrog is NotSpecified or bool(self._isLeapFrog)
+        return (steps, False, True, needForces, False)
+
+    def report(self, simulation, state):
+        """Generate a report.
+
+        Parameters:
+         - simulation (Simulation) The Simulation to generate a report for
+         - state (State) The current state of the simulation
+        """
+        if self._out is None:
+            self._initialize(simulation)
+
+        step = simulation.currentStep
+        if self._lastStep is not None and step <= self._lastStep:
+            # this frame is already in the file we're appending to
+            return
+        self._lastStep = step
+
+        velocities = state.getVelocities(asNumpy=True).value_in_unit(nanometer / picosecond)
+        if self._isLeapFrog:
+            dt = simulation.context.getIntegrator().getStepSize().value_in_unit(picoseconds)
+            forces = state.getForces(asNumpy=True).value_in_unit(kilojoules_per_mole / nanometer)
+            velocities = velocities + forces * (0.5 * dt * self._invMasses)[:, np.newaxis]
+
+        scale = 1.0
+        if self._valueDtype.itemsize < 4:
+            scale = float(np.max(np.abs(velocities))) or 1.0
+
+        frame = np.zeros(1, dtype=self._frameDtype)
+        frame['step'] = step
+        frame['time'] = state.getTime().value_in_unit(picoseconds)
+        frame['scale'] = scale
+        frame['values'] = velocities / scale
+        frame.tofile(self._out)
+        self._out.flush()
+
+    def __del__(self):
+        if self._out is not None:
+            self._out.close()
@@ -2,6 +2,7 @@
 # Imports
 #-----------------------------------------------------------------------------
 
+import sys
 from simtk.openmm import CustomIntegrator
 
 #-----------------------------------------------------------------------------
@@ -10,6 +11,27 @@ from simtk.openmm import CustomIntegrator
 
 def VelocityVerletIntegrator(timestep):
     # Velocity Verlet integrator with explicit velocities.
+    #
+    # The positions before the drift are kept in x1, so the velocity after
+    # the position constraints is just the distance moved over dt. That
+    # includes the constraint correction, without needing a second copy of
+    # the positions, and folds it into the second half kick.
+    integrator = CustomIntegrator(timestep)
+    integrator.addPerDofVariable("x1", 0)
+    integrator.addUpdateContextState()
+    integrator.addComputePerDof("v", "v+0.5*dt*f/m")
+    integrator.addComputePerDof("x1", "x")
+    integrator.addComputePerDof("x", "x+dt*v")
+    integrator.addConstrainPositions()
+    integrator.addComputePerDof("v", "(x-x1)/dt+0.5*dt*f/m")
+    integrator.addConstrainVelocities()
+    return integrator
+
+
+def TwoBufferVelocityVerletIntegrator(timestep):
+    # The original version of VelocityVerletIntegrator, which copies the
+    # positions before and after the constraints into x1 and x2. It is kept
+    # for comparison with the current version.
     integrator = CustomIntegrator(timestep)
     integrator.addPerDofVariable("x1", 0)
     integrator.addPerDofVariable("x2", 0)
@@ -22,3 +44,53 @@ def VelocityVerletIntegrator(timestep):
     integrator.addComputePerDof("v", "v+0.5*dt*f/m+(x2-x1)/dt")
     integrator.addConstrainVelocities()
     return integrator
+
+
+def compareIntegrators(system, positions, platformName, boxVectors=None, numSteps=1000,
+                       file=sys.stdout):
+    """Time both versions of the velocity Verlet integrator on a System, and
+    report the per-step cost and the memory used by their per-DOF variables.
+
+    Parameters:
+     - system (System) The system to time
+     - positions (list) The positions of the particles
+     - platformName (string) The platform to run on
+     - boxVectors (tuple) The periodic box vectors, if they differ from the
+       default ones in the System
+     - numSteps (int) The maximum number of steps to time
+     - file (file) Where to print the report
+    """
+    from simtk import unit
+    import simtk.openmm as mm
+    from .benchmark import timeSteps
+
+    print >>file, '%-36s %12s %16s' % ('Integrator', 'ms/step', 'Per-DOF MB')
+    for create in [TwoBufferVelocityVerletIntegrator, VelocityVerletIntegrator]:
+        integrator = create(1 * unit.femtoseconds)
+        context = mm.Context(system, integrator, mm.Platform.getPlatformByName(platformName))
+        if boxVectors is not None:
+            context.setPeriodicBoxVectors(*boxVectors)
+        context.setPositions(positions)
+        context.setVelocitiesToTemperature(300 * unit.kelvin)
+        seconds = timeSteps(context, numSteps, minTime=5.0)
+        # three doubles for each particle, per variable
+        megabytes = integrator.getNumPerDofVariables() * system.getNumParticles() * 24 / float(1 << 20)
+        print >>file, '%-36s %12.3f %16.1f' % (create.__name__, 1000 * seconds, megabytes)
+        del context, integrator
+
+
+if __name__ == '__main__':
+    # Compare the two versions on a box of water, e.g.
+    # python -m ipcfg.velocityverlet CUDA 8
+    from simtk import unit
+    from simtk.openmm import app, Vec3
+
+    platformName = sys.argv[1] if len(sys.argv) > 1 else 'CPU'
+    size = float(sys.argv[2]) if len(sys.argv) > 2 else 6.0
+    forcefield = app.ForceField('amber99sb.xml', 'tip3p.xml')
+    modeller = app.Modeller(app.Topology(), [])
+    modeller.addSolvent(forcefield, boxSize=Vec3(size, size, size) * unit.nanometers)
+    system = forcefield.createSystem(modeller.topology, nonbondedMethod=app.PME,
+                                     nonbondedCutoff=0.9 * unit.nanometers, constraints=app.HBonds)
+    print 'Water box of %g nm, %d atoms, on the %s platform' % (size, system.getNumParticles(), platformName)
+    compareIntegrators(system, modeller.positions, platformName)
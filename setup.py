@@ -5,7 +5,7 @@ way.  It is roughly equivalent to to `grompp/mdrun` in Gromacs,
 `dynamic` in Tinker, and `pmemd` in Amber.
 
 To install this package, run `python setup.py install`. The only dependencies
-are python and OpenMM.
+are python, numpy and OpenMM.
 
 For the short help, run `openmm -h`. To get help on all available options,
 run `openmm --help-all`.
@@ -114,10 +114,36 @@ def find_packages(extra_exclude=None):
     return packages
 
 
+def find_data_files(directory, target):
+    """Find all of the files inside a directory, for installing them under
+    target with the same layout.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to install
+    target : str
+        The directory to install it into, relative to the installation prefix
+
+    Returns
+    -------
+    data_files : list
+        A list of (target directory, files) pairs, for setup()
+    """
+    data_files = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        if len(filenames) > 0:
+            data_files.append((os.path.join(target, dirpath),
+                               [os.path.join(dirpath, fn) for fn in filenames]))
+    return data_files
+
+
 if __name__ == '__main__':
     setup(name=NAME,
           scripts=SCRIPTS,
           packages=find_packages(),
+          # `openmm benchmark` runs the examples, from share/openmm-cmd/examples
+          data_files=find_data_files('examples', os.path.join('share', 'openmm-cmd')),
           version=VERSION,
           author=AUTHOR,
           author_email=AUTHOR_EMAIL,